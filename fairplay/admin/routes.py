@@ -1,9 +1,19 @@
 from flask import Blueprint, render_template
 
+from ..audit import get_audit_stats
+from ..utils.geoip import get_cache_stats
+from ..utils.passlib import get_hashing_stats
+
 
 admin = Blueprint("admin", __name__, template_folder="templates", url_prefix="/admin")
 
 
 @admin.route("")
 def index():
-    return render_template("admin/index.html")
+    # stats are kept per worker, so they're for whichever one served this request
+    return render_template(
+        "admin/index.html",
+        audit_stats=get_audit_stats(),
+        geoip_cache_stats=get_cache_stats(),
+        hashing_stats=get_hashing_stats(),
+    )
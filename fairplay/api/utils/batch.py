@@ -0,0 +1,108 @@
+import collections
+
+import sqlalchemy as sa
+
+from flask import abort, current_app, request
+from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from ...db import db, invalidate_resource_cache_rows
+
+
+def get_batch_data():
+    """Return the list of items in the request body for a batch endpoint."""
+    data = request.json
+
+    if not isinstance(data, list):
+        raise ValidationError("Expected a list of items", "_schema")
+
+    max_size = current_app.config.get("API_BATCH_MAX_SIZE", 100)
+    if len(data) > max_size:
+        raise ValidationError(f"Expected at most {max_size} items", "_schema")
+
+    return data
+
+
+def validate_unique(rows, key):
+    """Raise a validation error if more than one row has the same value for key."""
+    seen = set()
+    for i, row in enumerate(rows):
+        if key not in row:
+            raise ValidationError({i: {key: ["Missing data for required field."]}})
+        if row[key] in seen:
+            raise ValidationError({i: {key: ["Duplicate value in batch."]}})
+        seen.add(row[key])
+
+
+def bulk_create(model, rows):
+    """Insert rows with a single multi-row ``INSERT`` and return the new objects.
+
+    This skips the unit of work, so aggregates need to be updated by the caller.
+    """
+    if not rows:
+        return []
+
+    try:
+        result = db.session.execute(sa.insert(model).returning(model), rows)
+        return result.scalars().all()
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, "One or more items conflict with existing records")
+
+
+def bulk_delete(model, *criteria):
+    """Delete matching rows with a single ``DELETE`` and return how many."""
+    table = model.__table__
+
+    statement = sa.delete(table).where(*criteria)
+    statement = statement.returning(*model.get_identity_columns())
+
+    rows = db.session.execute(statement).all()
+    invalidate_resource_cache_rows(model, rows, db.session())
+
+    return len(rows)
+
+
+def bulk_update(model, rows, *criteria, key="id"):
+    """Update existing rows, matched on ``key`` within criteria, and return their ids.
+
+    Rows are grouped by the columns they change, and each group is written with a
+    single executemany ``UPDATE``.
+    """
+    if not rows:
+        return []
+
+    mapper = sa.inspect(model)
+    table = model.__table__
+    key_column = getattr(model, key)
+
+    columns = {c.key: c for c in (key_column, *model.get_identity_columns())}
+
+    statement = sa.select(*columns.values())
+    statement = statement.where(*criteria, key_column.in_([r[key] for r in rows]))
+    existing = {getattr(r, key): r for r in db.session.execute(statement)}
+
+    missing = [r[key] for r in rows if r[key] not in existing]
+    if missing:
+        raise ValidationError(f"Not found: {', '.join(map(str, missing))}", key)
+
+    groups = collections.defaultdict(list)
+    for row in rows:
+        values = {k: v for k, v in row.items() if k != key}
+        if not values:
+            continue
+
+        params = {f"_{k}": v for k, v in values.items()}
+        params["_id"] = existing[row[key]].id
+        groups[tuple(sorted(values))].append(params)
+
+    for names, params in groups.items():
+        values = {mapper.columns[n].name: sa.bindparam(f"_{n}") for n in names}
+        values["version"] = table.c.version + 1
+
+        statement = sa.update(table).where(table.c.id == sa.bindparam("_id"))
+        db.session.execute(statement.values(values), params)
+
+    invalidate_resource_cache_rows(model, existing.values(), db.session())
+
+    return [r.id for r in existing.values()]
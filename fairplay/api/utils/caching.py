@@ -0,0 +1,59 @@
+import datetime as dt
+
+from flask import abort, current_app, make_response, request
+from werkzeug.http import http_date, unquote_etag
+
+from ...cache import near_cache
+from .conditional import generate_etag
+
+
+def get_cached_resource(model, schema, load, **identity):
+    """Return a serialized resource along with its ETag and last modified date.
+
+    Resources are read through the near cache, ``load`` is only called to get the
+    object from the database on a miss. Entries are invalidated by the ORM listeners
+    on ``BaseModel`` when rows are changed.
+    """
+    try:
+        cache_key = model.get_resource_cache_key(**identity)
+    except (TypeError, ValueError):
+        abort(404)
+
+    local_ttl = current_app.config.get("API_CACHE_WORKER_SECONDS")
+
+    resource = near_cache.get(cache_key, local_ttl)
+    if not resource:
+        obj = load()
+
+        last_modified = obj.last_updated_date
+        if not last_modified.tzinfo:
+            last_modified = last_modified.replace(tzinfo=dt.timezone.utc)
+
+        resource = {
+            "data": schema.dump(obj),
+            "etag": generate_etag(obj, schema),
+            "last_modified": last_modified,
+        }
+
+        ttl = current_app.config.get("API_CACHE_SECONDS", 300)
+        near_cache.set(cache_key, resource, ttl, local_ttl)
+
+    return resource
+
+
+def make_resource_response(resource):
+    """Respond with a cached resource, or 304 if the client's copy is current."""
+    etag = resource["etag"]
+    last_modified = resource["last_modified"]
+
+    headers = {"ETag": etag, "Last-Modified": http_date(last_modified)}
+
+    if request.if_none_match:
+        tag, _ = unquote_etag(etag)
+        if request.if_none_match.contains_weak(tag):
+            return make_response("", 304, headers)
+    elif request.if_modified_since:
+        if last_modified.replace(microsecond=0) <= request.if_modified_since:
+            return make_response("", 304, headers)
+
+    return resource["data"], headers
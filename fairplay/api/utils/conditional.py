@@ -1,6 +1,7 @@
 import hashlib
 
-from flask import abort, after_this_request, g, make_response, request
+from flask import abort, after_this_request, current_app, g, make_response, request
+from werkzeug.http import http_date, unquote_etag
 
 
 def add_etag_header(obj, schema, generate_etag_func=None):
@@ -21,17 +22,29 @@ def add_last_modified_header(obj, attr="last_updated_date"):
 
     @after_this_request
     def add_last_modified_header(response):
-        response.headers["Last-Modified"] = last_modified
+        response.headers["Last-Modified"] = http_date(last_modified)
 
         return response
 
 
 def check_if_match(obj, schema, generate_etag_func=None):
+    if not request.if_match:
+        # clients have to send one, unless API_REQUIRE_IF_MATCH is turned off
+        if current_app.config.get("API_REQUIRE_IF_MATCH", True):
+            abort(412)
+        return
+
     if not generate_etag_func:
         generate_etag_func = generate_etag
     etag = generate_etag_func(obj, schema)
 
-    if etag not in request.if_match:
+    tag, weak = unquote_etag(etag)
+    if weak:
+        matches = request.if_match.contains_weak(tag)
+    else:
+        matches = request.if_match.contains(tag)
+
+    if not matches:
         abort(412)
 
 
@@ -47,7 +60,8 @@ def check_if_none_match(obj, schema, generate_etag_func=None):
     if not hasattr(g, "_etag"):
         g._etag = generate_etag_func(obj, schema)
 
-    if g._etag in request.if_none_match:
+    tag, _ = unquote_etag(g._etag)
+    if request.if_none_match.contains_weak(tag):
         abort(make_response("", 304))
 
 
@@ -58,6 +72,11 @@ def check_if_unmodified_since(obj, attr="last_updated_date"):
 
 
 def generate_etag(obj, schema):
+    # models can generate an etag from their version without serializing anything
+    get_etag = getattr(obj, "get_etag", None)
+    if get_etag:
+        return get_etag()
+
     data = schema.dumps(obj)
     h = hashlib.sha1(data.encode("utf-8"))
     return f'W/"{h.hexdigest()[:8]}"'
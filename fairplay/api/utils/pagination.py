@@ -1,61 +1,160 @@
 import base64
+import datetime as dt
+import hashlib
 import json
+import math
+import uuid
 
-from flask import after_this_request, request, url_for
+import sqlalchemy as sa
+
+from flask import abort, after_this_request, current_app, request, url_for
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+from ...cache import shared_cache
+from ...db import Explain, db
+
+
+TOTAL_MODES = ("none", "estimated", "exact")
+
+
+def _decode_cursor(cursor, columns):
+    # cursors come from the client, so anything but the expected shape is invalid
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+
+        if direction not in ("next", "prev"):
+            raise ValueError("Invalid direction")
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Invalid values")
+
+        values = [_decode_value(v, c) for v, c in zip(values, columns)]
+    except (AttributeError, TypeError, ValueError):
+        abort(400, "Invalid pagination cursor")
+
+    return direction, values
+
+
+def _decode_value(value, column):
+    if value is None:
+        return
+
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+
+    if issubclass(python_type, dt.datetime):
+        return dt.datetime.fromisoformat(value)
+    elif issubclass(python_type, dt.date):
+        return dt.date.fromisoformat(value)
+    elif issubclass(python_type, uuid.UUID):
+        return uuid.UUID(value)
+
+    return value
+
+
+def _encode_cursor(direction, values):
+    data = json.dumps([direction, [_encode_value(v) for v in values]])
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def _encode_value(value):
+    if isinstance(value, (dt.date, dt.datetime)):
+        return value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+
+    return value
+
+
+def _get_sort_key(expression):
+    if isinstance(expression, UnaryExpression):
+        if expression.modifier is operators.desc_op:
+            return expression.element, True
+        elif expression.modifier is operators.asc_op:
+            return expression.element, False
+
+    return expression, False
 
 
 def apply_cursor_pagination(
     query,
-    expression,
+    *order_by,
     cursor_param="cursor",
     limit_default=20,
     limit_max=1000,
     limit_param="limit",
 ):
+    """Paginate a query by seeking past the sort key of the last row.
+
+    The sort key should be unique, e.g. ``(Model.created_date, Model.id)``, and all
+    its columns must sort in the same direction. No ``OFFSET`` or ``COUNT`` is used,
+    so every page costs the same no matter how deep it is.
+    """
+    if not order_by:
+        raise ValueError("Cursor pagination requires at least one sort column")
+
+    sort_keys = [_get_sort_key(e) for e in order_by]
+    columns = [c for c, _ in sort_keys]
+
+    descending = {d for _, d in sort_keys}
+    if len(descending) > 1:
+        raise ValueError("Cursor pagination sort columns must share a direction")
+    descending = descending.pop()
+
     cursor = request.args.get(cursor_param)
 
     if cursor:
-        direction, value, offset = json.loads(base64.b64decode(cursor).decode("utf-8"))
+        direction, values = _decode_cursor(cursor, columns)
     else:
-        direction = "next"
-        value = ""
-        offset = 0
+        direction, values = "next", None
 
     limit = request.args.get(limit_param, limit_default, type=int)
-    limit = min(limit_max, limit)
+    limit = max(1, min(limit_max, limit))
 
-    if direction == "next":
-        query = query.filter(expression > value)
-    elif direction == "prev":
-        query = query.filter(expression < value)
+    backwards = (direction == "prev") != descending
 
-    query = query.limit(limit).offset(offset)
+    if values is not None:
+        key = sa.tuple_(*columns)
+        value = sa.tuple_(*(sa.literal(v, c.type) for v, c in zip(values, columns)))
+        query = query.filter(key < value if backwards else key > value)
 
-    count = query.count()
+    if backwards:
+        query = query.order_by(*(c.desc() for c in columns))
+    else:
+        query = query.order_by(*(c.asc() for c in columns))
 
-    args = request.args.copy()
-    args.pop("cursor", None)
+    # fetch one extra row to find out if there is another page without counting
+    items = query.limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
 
-    cursor = base64.b64encode(json.dumps([direction, value, offset])).decode("utf-8")
+    if direction == "prev":
+        items.reverse()
 
-    next_value = ""
-    next_offset = 0
-    next_cursor = base64.b64encode(
-        json.dumps(["next", next_value, next_offset])
-    ).decode("utf-8")
+    count = len(items)
 
-    prev_value = ""
-    prev_offset = 0
-    prev_cursor = base64.b64encode(
-        json.dumps(["prev", prev_value, prev_offset])
-    ).decode("utf-8")
+    args = request.args.copy()
+    args.pop(cursor_param, None)
 
     link_header = {
-        "self": url_for(request.endpoint, cursor=cursor, **request.args),
-        "next": url_for(request.endpoint, cursor=next_cursor, **request.args),
-        "prev": url_for(request.endpoint, cursor=prev_cursor, **request.args),
+        "self": url_for(request.endpoint, **request.view_args, **request.args)
     }
 
+    if items:
+        first_values = [getattr(items[0], c.key) for c in columns]
+        last_values = [getattr(items[-1], c.key) for c in columns]
+
+        if has_more or direction == "prev":
+            next_cursor = _encode_cursor("next", last_values)
+            args[cursor_param] = next_cursor
+            link_header["next"] = url_for(request.endpoint, **request.view_args, **args)
+        if cursor and (has_more or direction == "next"):
+            prev_cursor = _encode_cursor("prev", first_values)
+            args[cursor_param] = prev_cursor
+            link_header["prev"] = url_for(request.endpoint, **request.view_args, **args)
+
     link_header = ", ".join(f'<{url}>; rel="{rel}"' for rel, url in link_header.items())
 
     @after_this_request
@@ -64,114 +163,240 @@ def apply_cursor_pagination(
             {
                 "Link": link_header,
                 "X-Pagination-Count": count,
-                "X-Pagination-Cursor": cursor,
+                "X-Pagination-Cursor": cursor or "",
                 "X-Pagination-Limit": limit,
             }
         )
 
         return response
 
-    return query
+    return items
+
+
+def apply_pagination(query, *order_by, cursor_param="cursor"):
+    """Use cursor pagination if the client asked for it, else paged pagination.
+
+    Clients opt in to cursor pagination by passing the cursor parameter, which may be
+    empty for the first page.
+    """
+    if cursor_param in request.args:
+        return apply_cursor_pagination(query, *order_by, cursor_param=cursor_param)
+
+    return apply_paged_pagination(query.order_by(*order_by))
+
+
+def _get_total(query, mode):
+    if mode == "estimated":
+        total = _get_estimated_total(query)
+        if total is not None:
+            return total, mode
+
+        mode = "exact"
+
+    if mode == "exact":
+        return _get_exact_total(query), mode
+
+    return None, None
+
+
+def _get_estimated_total(query):
+    bind = query.session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    statement = query.order_by(None).statement
+    plan = query.session.execute(Explain(statement)).scalar()
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _get_total_cache_key(statement):
+    # cache totals per filter signature, i.e. the SQL and bound parameters
+    compiled = statement.compile(dialect=db.session.get_bind().dialect)
+    signature = f"{compiled}:{sorted(compiled.params.items())!r}"
+    h = hashlib.sha1(signature.encode("utf-8"))
+    return f"api.pagination.total:{h.hexdigest()}"
+
+
+@shared_cache.stale_if_error(
+    cache_key=_get_total_cache_key,
+    ttl=lambda: current_app.config.get("API_PAGINATION_TOTAL_CACHE_SECONDS", 30),
+)
+def _count_total(statement):
+    # this may run on a background thread, so it can't use the request's session
+    statement = sa.select(sa.func.count()).select_from(statement.subquery())
+    return db.session.execute(statement).scalar()
+
+
+def _get_exact_total(query):
+    query = query.order_by(None)
+
+    if not current_app.config.get("API_PAGINATION_TOTAL_CACHE_SECONDS", 30):
+        return query.count()
+
+    # counting is slow on large tables, so a stale total is returned while it's
+    # counted again, and only one caller counts a missing total
+    return _count_total(query.statement)
+
+
+def _get_total_mode(count_param):
+    mode = request.args.get(count_param)
+    if not mode:
+        mode = current_app.config.get("API_PAGINATION_TOTAL", "none")
+
+    if mode not in TOTAL_MODES:
+        abort(400, f"Invalid {count_param}, must be one of: {', '.join(TOTAL_MODES)}")
+
+    return mode
 
 
 def apply_paged_pagination(
     query,
+    count_param="count",
     page_param="page",
     per_page_default=20,
     per_page_max=1000,
     per_page_param="per_page",
 ):
+    """Paginate a query by page number.
+
+    The total is only calculated if asked for with ``?count=exact`` or
+    ``?count=estimated``, one extra row is fetched to find out if there is a next page.
+    """
     page = request.args.get(page_param, 1, type=int)
     per_page = request.args.get(per_page_param, per_page_default, type=int)
+    per_page = min(per_page_max, per_page)
+
+    if page < 1 or per_page < 1:
+        abort(404)
 
-    results = query.paginate(
-        page=page, per_page=per_page, error_out=True, max_per_page=per_page_max
-    )
+    mode = _get_total_mode(count_param)
 
-    count = len(results.items)
+    items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+
+    if not items and page > 1:
+        abort(404)
+
+    count = len(items)
+
+    total, mode = _get_total(query, mode)
 
     args = request.args.copy()
-    link_header = {"self": url_for(request.endpoint, **request.args)}
-    args.pop("page", None)
+    link_header = {"self": url_for(request.endpoint, **request.view_args, **args)}
+    args.pop(page_param, None)
 
-    if results.has_next:
-        link_header["next"] = url_for(request.endpoint, page=results.next_num, **args)
-    if results.has_prev:
-        link_header["prev"] = url_for(request.endpoint, page=results.prev_num, **args)
+    if has_next:
+        link_header["next"] = url_for(
+            request.endpoint, **request.view_args, **{page_param: page + 1}, **args
+        )
+    if page > 1:
+        link_header["prev"] = url_for(
+            request.endpoint, **request.view_args, **{page_param: page - 1}, **args
+        )
 
     link_header = ", ".join(f'<{url}>; rel="{rel}"' for rel, url in link_header.items())
 
-    @after_this_request
-    def add_pagination_headers(response):
-        response.headers.update(
+    headers = {
+        "Link": link_header,
+        "X-Pagination-Count": count,
+        "X-Pagination-Page": page,
+        "X-Pagination-Per-Page": per_page,
+    }
+
+    if total is not None:
+        headers.update(
             {
-                "Link": link_header,
-                "X-Pagination-Count": count,
-                "X-Pagination-Page": page,
-                "X-Pagination-Pages": results.pages,
-                "X-Pagination-Per-Page": results.per_page,
-                "X-Pagination-Total": results.total,
+                "X-Pagination-Pages": max(1, math.ceil(total / per_page)),
+                "X-Pagination-Total": total,
+                "X-Pagination-Total-Type": mode,
             }
         )
 
+    @after_this_request
+    def add_pagination_headers(response):
+        response.headers.update(headers)
+
         return response
 
-    return results
+    return items
 
 
 def apply_limit_offset_pagination(
     query,
+    count_param="count",
     limit_default=20,
     limit_param="limit",
     limit_max=1000,
     offset_param="offset",
 ):
+    """Paginate a query by limit and offset.
+
+    The total is only calculated if asked for with ``?count=exact`` or
+    ``?count=estimated``, one extra row is fetched to find out if there is a next page.
+    """
     limit = request.args.get(limit_param, limit_default, type=int)
-    limit = min(limit_max, limit)
+    limit = max(1, min(limit_max, limit))
 
-    offset = request.args.get(offset_param, 0, type=int)
+    offset = max(0, request.args.get(offset_param, 0, type=int))
 
-    total = query.count()
+    mode = _get_total_mode(count_param)
 
-    query = query.limit(limit).offset(offset)
+    items = query.limit(limit + 1).offset(offset).all()
+    has_next = len(items) > limit
+    items = items[:limit]
 
-    count = query.count()
+    count = len(items)
 
-    args = request.args.copy()
-    link_header = {"self": url_for(request.endpoint, **request.args)}
-    args.pop("offset", None)
+    total, mode = _get_total(query, mode)
 
-    if offset + count < total:
-        link_header["next"] = url_for(request.endpoint, offset=offset + count, **args)
+    args = request.args.copy()
+    link_header = {"self": url_for(request.endpoint, **request.view_args, **args)}
+    args.pop(offset_param, None)
+
+    if has_next:
+        link_header["next"] = url_for(
+            request.endpoint,
+            **request.view_args,
+            **{offset_param: offset + count},
+            **args,
+        )
     if offset > 0:
-        prev_offset = offset - count
-        prev_count = count
-
         # handle odd case where pagination limit may have changed
-        if prev_offset < 0:
-            prev_offset = 0
-            prev_count = abs(prev_offset)
+        prev_offset = max(0, offset - limit)
+        prev_limit = offset - prev_offset
 
-        args.pop("count", None)
+        args.pop(limit_param, None)
 
         link_header["prev"] = url_for(
-            request.endpoint, offset=prev_offset, count=prev_count, **args
+            request.endpoint,
+            **request.view_args,
+            **{offset_param: prev_offset, limit_param: prev_limit},
+            **args,
         )
 
     link_header = ", ".join(f'<{url}>; rel="{rel}"' for rel, url in link_header.items())
 
-    @after_this_request
-    def add_pagination_headers(response):
-        response.headers.update(
+    headers = {
+        "Link": link_header,
+        "X-Pagination-Count": count,
+        "X-Pagination-Limit": limit,
+        "X-Pagination-Offset": offset,
+    }
+
+    if total is not None:
+        headers.update(
             {
-                "Link": link_header,
-                "X-Pagination-Count": count,
-                "X-Pagination-Limit": limit,
-                "X-Pagination-Offset": offset,
                 "X-Pagination-Total": total,
+                "X-Pagination-Total-Type": mode,
             }
         )
 
+    @after_this_request
+    def add_pagination_headers(response):
+        response.headers.update(headers)
+
         return response
 
-    return query
+    return items
@@ -0,0 +1,92 @@
+import datetime as dt
+import functools
+
+import sqlalchemy as sa
+
+from marshmallow import fields
+
+
+FAST_SERIALIZERS = {
+    fields.Boolean: bool,
+    fields.Date: dt.date.isoformat,
+    fields.DateTime: dt.datetime.isoformat,
+    fields.Float: float,
+    fields.Integer: int,
+    fields.String: str,
+    fields.UUID: str,
+}
+
+
+def _compile_field(attr, field):
+    serialize = FAST_SERIALIZERS.get(type(field))
+
+    # anything beyond a plain value still goes through marshmallow
+    if (
+        not serialize
+        or getattr(field, "as_string", False)
+        or getattr(field, "format", None) not in (None, "iso")
+    ):
+        return functools.partial(field.serialize, attr)
+
+    def dump(row):
+        value = getattr(row, attr)
+        if value is None:
+            return
+        return serialize(value)
+
+    return dump
+
+
+_compiled_schemas = {}
+
+
+def compile_schema(schema):
+    """Return the columns and field serializers needed to dump rows for a schema.
+
+    The result is cached per schema class and set of dumped fields, so it is only
+    worked out once per process.
+    """
+    cache_key = (type(schema), tuple(schema.dump_fields))
+
+    try:
+        return _compiled_schemas[cache_key]
+    except KeyError:
+        pass
+
+    model = schema.opts.model
+    column_attrs = sa.inspect(model).column_attrs
+
+    columns = []
+    dumpers = []
+    for key, field in schema.dump_fields.items():
+        attr = field.attribute or key
+        if attr not in column_attrs:
+            raise ValueError(f"{model.__name__}.{attr} is not a column")
+
+        columns.append(getattr(model, attr))
+        dumpers.append((field.data_key or key, _compile_field(attr, field)))
+
+    compiled = _compiled_schemas[cache_key] = (tuple(columns), tuple(dumpers))
+
+    return compiled
+
+
+def dump_rows(schema, rows):
+    """Dump rows selected with :func:`with_schema_columns` using a schema."""
+    _, dumpers = compile_schema(schema)
+
+    return [{key: dump(row) for key, dump in dumpers} for row in rows]
+
+
+def with_schema_columns(query, schema, *extra_columns):
+    """Only select the columns dumped by a schema instead of full model instances.
+
+    This also skips eager loading any relationships. Columns needed by something
+    else, like the sort key for cursor pagination, can be passed as extra columns.
+    """
+    columns, _ = compile_schema(schema)
+
+    keys = {c.key for c in columns}
+    extra_columns = [c for c in extra_columns if c.key not in keys]
+
+    return query.with_entities(*columns, *extra_columns)
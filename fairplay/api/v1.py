@@ -1,6 +1,7 @@
 from flask import Blueprint
 from marshmallow import Schema, ValidationError, fields
 from flask_wtf.csrf import CSRFError
+from sqlalchemy.orm.exc import StaleDataError
 
 from . import api
 from .. import __version__
@@ -124,6 +125,28 @@ def conflict(e):
     }, 409
 
 
+@v1.errorhandler(412)
+def precondition_failed(e):
+    return {
+        "error": {
+            "code": 412,
+            "description": e.description,
+            "name": "precondition_failed",
+        }
+    }, 412
+
+
+@v1.errorhandler(StaleDataError)
+def stale_data(e):
+    return {
+        "error": {
+            "code": 412,
+            "description": "The resource was changed by another request",
+            "name": "precondition_failed",
+        }
+    }, 412
+
+
 @v1.errorhandler(415)
 def unsupported_media_type(e):
     return {
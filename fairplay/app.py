@@ -2,6 +2,7 @@ from flask import Flask
 from sqlalchemy.orm import configure_mappers
 
 from . import auth
+from .audit import init_audit
 from .cache import init_cache
 from .config import configure_app
 from .db import init_db
@@ -19,6 +20,7 @@ def create_app(**options):
 
     init_cache(app)
     init_db(app)
+    init_audit(app)
     init_i18n(app)
 
     init_captcha(app)
@@ -1,25 +1,35 @@
+import atexit
 import calendar
+import collections
 import datetime as dt
 import logging
+import queue
+import re
+import threading
 import uuid
 
+import click
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 import sqlalchemy.event as event
 import sqlalchemy_utils
 
 from flask import current_app, g, has_app_context, has_request_context, request
+from flask.cli import AppGroup
 from sqlalchemy.dialects.postgresql import INET, JSONB
 
 from .auth import current_user
 from .db import BaseModel, BaseQuery, ServerUUID, db
 from .i18n import _
+from .utils.background import PerProcess
 from .utils.datetime import aware_datetime
-from .utils.geoip import get_location
+from .utils.geoip import format_location, get_location, get_results
 
 
 logger = logging.getLogger("fairplay.audit")
 
+_known_partitions = None
+
 
 def default_request_id():
     if not has_request_context():
@@ -89,7 +99,12 @@ class AuditEvent(BaseModel):
     )
 
     record = sqlalchemy_utils.generic_relationship(record_model, record_id)
-    user = orm.relationship("User", lazy="joined")
+    user = orm.relationship("User")
+
+    load_profiles = {
+        **BaseModel.load_profiles,
+        "admin-detail": {"*": "select", "user": "joined"},
+    }
 
     __table_args__ = (
         sa.PrimaryKeyConstraint(date, "id", name="pk_audit_date_id"),
@@ -122,26 +137,408 @@ class AuditEvent(BaseModel):
     @classmethod
     def __declare_last__(cls):
         def create_partition(mapper, connection, target):
-            date = target.date or aware_datetime()
-            date_string = date.strftime("%Y%m")
-
-            end_day = calendar.monthrange(date.year, date.month)[1]
-            date_from = date.replace(day=1).strftime("%Y-%m-%d")
-            date_to = date.replace(day=end_day) + dt.timedelta(days=1)
-            date_to = date_to.strftime("%Y-%m-%d")
-
-            tablename = cls.__tablename__
-            partition_name = f"{tablename}_{date_string}"
-
-            db.session.execute(
-                sa.text(
-                    f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF "
-                    f"{tablename} FOR VALUES FROM ('{date_from}') TO ('{date_to}')"
-                )
-            )
+            cls.create_partition(connection, target.date or aware_datetime())
 
         event.listen(cls, "before_insert", create_partition)
 
+    @classmethod
+    def create_partition(cls, connection, date):
+        """Create the monthly partition for date and return its name.
+
+        Partitions known to exist in this process, or created earlier in the same
+        transaction, are skipped without any DDL, so this is cheap enough to call
+        before every insert.
+        """
+        if connection.dialect.name != "postgresql":
+            return
+
+        partition_name = cls.get_partition_name(date)
+        if partition_name in _get_known_partitions(connection):
+            return
+
+        created_partitions = _get_created_partitions(connection)
+        if partition_name in created_partitions:
+            return
+
+        end_day = calendar.monthrange(date.year, date.month)[1]
+        date_from = date.replace(day=1).strftime("%Y-%m-%d")
+        date_to = date.replace(day=end_day) + dt.timedelta(days=1)
+        date_to = date_to.strftime("%Y-%m-%d")
+
+        tablename = cls.__tablename__
+
+        connection.execute(
+            sa.text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF "
+                f"{tablename} FOR VALUES FROM ('{date_from}') TO ('{date_to}')"
+            )
+        )
+
+        created_partitions.add(partition_name)
+
+        return partition_name
+
+    @classmethod
+    def detach_partitions(cls, connection, date, drop=False):
+        """Detach, or drop, the monthly partitions before date and return them."""
+        if connection.dialect.name != "postgresql":
+            return []
+
+        tablename = cls.__tablename__
+        partition_name = cls.get_partition_name(date)
+
+        partition_names = [
+            name for name in cls.get_partitions(connection) if name < partition_name
+        ]
+
+        for name in partition_names:
+            connection.execute(
+                sa.text(f"ALTER TABLE {tablename} DETACH PARTITION {name}")
+            )
+            if drop:
+                connection.execute(sa.text(f"DROP TABLE {name}"))
+
+            _get_known_partitions(connection).discard(name)
+
+        return partition_names
+
+    @classmethod
+    def get_partition_name(cls, date):
+        return f"{cls.__tablename__}_{date.strftime('%Y%m')}"
+
+    @classmethod
+    def get_partitions(cls, connection):
+        """Return the names of the monthly partitions attached to the table."""
+        if connection.dialect.name != "postgresql":
+            return []
+
+        result = connection.execute(
+            sa.text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = :tablename"
+            ),
+            {"tablename": cls.__tablename__},
+        )
+
+        pattern = re.compile(rf"{cls.__tablename__}_\d{{6}}")
+
+        return sorted(name for name in result.scalars() if pattern.fullmatch(name))
+
+
+def _add_months(date, months):
+    year, month = divmod(date.month - 1 + months, 12)
+    return date.replace(year=date.year + year, month=month + 1, day=1)
+
+
+def _get_known_partitions(connection):
+    global _known_partitions
+
+    if _known_partitions is None:
+        _known_partitions = set(AuditEvent.get_partitions(connection))
+
+    return _known_partitions
+
+
+def _get_created_partitions(connection):
+    """Return the partitions created in the connection's current transaction.
+
+    They're only added to the known partitions once the transaction commits, until
+    then they're skipped by later inserts in the same transaction.
+    """
+    transaction = connection.get_transaction()
+
+    created = connection.info.get("audit_created_partitions")
+    if created and created[0] is transaction:
+        return created[1]
+
+    # a transaction that rolled back leaves its listener behind, which does nothing
+    partitions = set()
+    connection.info["audit_created_partitions"] = transaction, partitions
+
+    def remember_partitions(connection):
+        if connection.get_transaction() is transaction:
+            _get_known_partitions(connection).update(partitions)
+
+    event.listen(connection, "commit", remember_partitions, once=True)
+
+    return partitions
+
+
+BACKPRESSURE_POLICIES = ("block", "drop", "flush")
+
+
+class AuditEventBuffer:
+    """Queue audit events in memory and write them in batches.
+
+    Events are written by a background thread every ``AUDIT_FLUSH_INTERVAL``
+    seconds, or as soon as ``AUDIT_BATCH_SIZE`` events are waiting, with a single
+    multi-row ``INSERT``. When ``AUDIT_QUEUE_SIZE`` events are waiting the
+    ``AUDIT_BACKPRESSURE`` policy decides whether to block, drop the event or flush
+    in the calling thread. A batch that fails to write is tried again up to
+    ``AUDIT_WRITE_RETRIES`` times, and then counted as lost.
+
+    Like unbuffered events, events are only queued once the session they were
+    recorded in commits, and dropped if it rolls back.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+        self.batch_size = app.config.get("AUDIT_BATCH_SIZE", 500)
+        self.flush_interval = app.config.get("AUDIT_FLUSH_INTERVAL", 1.0)
+        self.queue_size = app.config.get("AUDIT_QUEUE_SIZE", 10000)
+
+        self.backpressure = app.config.get("AUDIT_BACKPRESSURE", "block")
+        if self.backpressure not in BACKPRESSURE_POLICIES:
+            raise RuntimeError(f"Invalid AUDIT_BACKPRESSURE: {self.backpressure}")
+
+        self.retries = app.config.get("AUDIT_WRITE_RETRIES", 3)
+
+        self.dropped = self.lost = 0
+
+        # batches that failed to write, with the number of attempts, which are
+        # written before anything else is taken from the queue
+        self._failed = collections.deque()
+        self._lock = threading.Lock()
+        self._queue = None
+        self._started = PerProcess(self._start)
+        self._thread = None
+        self._wake = threading.Event()
+
+    def _start(self):
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="fairplay-audit", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                while self.flush():
+                    pass
+            except Exception:
+                logger.exception("Error writing audit events")
+
+    def put(self, values):
+        """Add the column values of an audit event to the queue."""
+        self._started.get()
+
+        try:
+            self._queue.put_nowait(values)
+        except queue.Full:
+            if self.backpressure == "drop":
+                with self._lock:
+                    self.dropped += 1
+                logger.warning("Audit queue is full, dropped %s event", values["event"])
+                return
+            elif self.backpressure == "flush":
+                self.flush()
+
+            self._queue.put(values)
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write up to a batch of queued events and return how many were written."""
+        if not self._started.created:
+            return 0
+
+        try:
+            attempts, rows = self._failed.popleft()
+        except IndexError:
+            attempts, rows = 0, []
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        if not rows:
+            return 0
+
+        try:
+            with self.app.app_context():
+                self.write(rows)
+        except Exception:
+            if attempts < self.retries:
+                logger.warning("Error writing audit events, retrying", exc_info=True)
+                self._failed.append((attempts + 1, rows))
+            else:
+                logger.exception("Error writing audit events, lost %s", len(rows))
+                with self._lock:
+                    self.lost += len(rows)
+
+            # the next attempt waits for the next flush
+            return 0
+
+        return len(rows)
+
+    def get_stats(self):
+        """Return the number of queued, retrying, dropped and lost events."""
+        with self._lock:
+            return {
+                "dropped": self.dropped,
+                "lost": self.lost,
+                "queued": self._queue and self._queue.qsize() or 0,
+                "retrying": sum(len(rows) for _, rows in list(self._failed)),
+            }
+
+    def write(self, rows):
+        """Write rows of audit events with a single ``INSERT``."""
+        try:
+            results = get_results(row["remote_addr"] for row in rows)
+            for row in rows:
+                if row["location"] is None and row["remote_addr"]:
+                    row["location"] = format_location(results[row["remote_addr"]])
+        except Exception:
+            logger.exception("Error getting location of audit events")
+
+        months = {row["date"].replace(day=1).date(): row["date"] for row in rows}
+
+        with db.engine.begin() as connection:
+            for date in months.values():
+                AuditEvent.create_partition(connection, date)
+
+            connection.execute(sa.insert(AuditEvent.__table__), rows)
+
+    def close(self):
+        """Write all queued events, retrying failed batches until they're lost."""
+        while self.flush() or self._failed:
+            pass
+
+
+audit_cli = AppGroup("audit", help="Manage audit events.")
+
+
+@audit_cli.command("create-partitions")
+@click.option("--months", type=int, help="Number of months ahead to create.")
+def create_partitions_command(months):
+    """Create the audit partitions for this month and the months ahead."""
+    if months is None:
+        months = current_app.config.get("AUDIT_PARTITION_MONTHS", 3)
+
+    date = aware_datetime()
+
+    with db.engine.begin() as connection:
+        for i in range(months + 1):
+            partition_name = AuditEvent.create_partition(
+                connection, _add_months(date, i)
+            )
+            if partition_name:
+                click.echo(f"Created partition {partition_name}")
+
+
+@audit_cli.command("prune-partitions")
+@click.option("--retention", type=int, help="Number of months to keep.")
+@click.option("--drop", is_flag=True, help="Drop partitions instead of detaching.")
+def prune_partitions_command(retention, drop):
+    """Detach or drop the audit partitions older than the retention window."""
+    if retention is None:
+        retention = current_app.config.get("AUDIT_RETENTION_MONTHS")
+    if not retention:
+        raise click.UsageError("No retention window set")
+
+    date = _add_months(aware_datetime(), -retention)
+
+    with db.engine.begin() as connection:
+        for partition_name in AuditEvent.detach_partitions(connection, date, drop):
+            action = drop and "Dropped" or "Detached"
+            click.echo(f"{action} partition {partition_name}")
+
+
+@audit_cli.command("backfill-locations")
+@click.option("--chunk-size", default=1000, help="Number of events per chunk.")
+@click.option("--refresh", is_flag=True, help="Refresh existing locations too.")
+def backfill_locations_command(chunk_size, refresh):
+    """Set the location of audit events from their IP address."""
+    table = AuditEvent.__table__
+
+    statement = sa.select(table.c.date, table.c.id, table.c.remote_addr)
+    statement = statement.where(table.c.remote_addr.isnot(None))
+    if not refresh:
+        statement = statement.where(table.c.location.is_(None))
+    statement = statement.order_by(table.c.date, table.c.id).limit(chunk_size)
+
+    update = sa.update(table).where(
+        table.c.date == sa.bindparam("_date"), table.c.id == sa.bindparam("_id")
+    )
+    update = update.values(location=sa.bindparam("_location"))
+
+    count = 0
+    last = None
+
+    while True:
+        chunk = statement
+        if last:
+            chunk = chunk.where(sa.tuple_(table.c.date, table.c.id) > last)
+
+        rows = db.session.execute(chunk).all()
+        if not rows:
+            break
+
+        results = get_results(row.remote_addr for row in rows)
+
+        params = [
+            {
+                "_date": row.date,
+                "_id": row.id,
+                "_location": format_location(results[str(row.remote_addr)]),
+            }
+            for row in rows
+        ]
+
+        db.session.execute(update, params)
+        db.session.commit()
+
+        count += len(rows)
+        last = rows[-1].date, rows[-1].id
+
+    click.echo(f"Updated location of {count} audit events")
+
+
+def get_audit_stats():
+    """Return the number of queued, retrying, dropped and lost buffered events for
+    this worker, or ``None`` if events aren't buffered."""
+    buffer = current_app.extensions.get("audit")
+    if buffer:
+        return buffer.get_stats()
+
+
+def enqueue_audit_events(session):
+    events = session.info.pop("audit_events", None)
+    if events:
+        buffer = current_app.extensions["audit"]
+        for values in events:
+            buffer.put(values)
+
+
+def discard_audit_events(session, previous_transaction):
+    # a savepoint rolling back leaves the rest of the transaction to commit
+    if previous_transaction.parent is None:
+        session.info.pop("audit_events", None)
+
+
+event.listen(db.session, "after_commit", enqueue_audit_events)
+event.listen(db.session, "after_soft_rollback", discard_audit_events)
+
+
+def init_audit(app):
+    """Write audit events through a buffer if ``AUDIT_BUFFERED`` is enabled."""
+    app.cli.add_command(audit_cli)
+
+    if not app.config.get("AUDIT_BUFFERED", False):
+        return
+
+    buffer = app.extensions["audit"] = AuditEventBuffer(app)
+    atexit.register(buffer.close)
+
 
 def audit(category, event, message, *args, context=None, record=None):
     if has_request_context():
@@ -151,16 +548,46 @@ def audit(category, event, message, *args, context=None, record=None):
     else:
         request_id = None
 
-    audit = AuditEvent(
-        category=category,
-        event=event,
-        message=message % args,
-        context=context,
-        record=record,
-        request_id=request_id,
-    )
+    buffer = has_app_context() and current_app.extensions.get("audit")
+
+    if buffer:
+        remote_addr = has_request_context() and request.remote_addr or None
+
+        audit = dict(
+            id=uuid.uuid4(),
+            date=aware_datetime(),
+            category=category,
+            event=event,
+            message=message % args,
+            context=context,
+            record_model=record and type(record).__name__ or None,
+            record_id=record and record.id or None,
+            location=None,
+            remote_addr=remote_addr,
+            request_id=request_id,
+            user_id=current_user and current_user.get_id() or None,
+        )
+
+        session = db.session()
+        if not session.in_transaction():
+            session.begin()
+
+        session.info.setdefault("audit_events", []).append(audit)
+
+        record_model, record_id = audit["record_model"], audit["record_id"]
+    else:
+        audit = AuditEvent(
+            category=category,
+            event=event,
+            message=message % args,
+            context=context,
+            record=record,
+            request_id=request_id,
+        )
+
+        db.session.add(audit)
 
-    db.session.add(audit)
+        record_model, record_id = audit.record_model, audit.record_id
 
     if not has_app_context():
         return
@@ -172,8 +599,8 @@ def audit(category, event, message, *args, context=None, record=None):
             "category": category,
             "event": event,
             "context": context,
-            "record_model": audit.record_model,
-            "record_id": audit.record_id and str(audit.record_id) or None,
+            "record_model": record_model,
+            "record_id": record_id and str(record_id) or None,
             "remote_addr": request and request.remote_addr or None,
             "request_id": str(request_id),
             "user_id": request and current_user.get_id() or None,
@@ -21,6 +21,7 @@ from ..admin.utils.pagination import apply_paged_pagination
 from ..audit import AuditEvent
 from ..db import db
 from ..i18n import _, get_locale, get_timezone, iter_locales, iter_timezones
+from ..utils.geoip import get_results
 from ..utils.security import safe_redirect
 from .models import User
 
@@ -37,30 +38,30 @@ users = Blueprint("users", __name__, url_prefix="/users")
 auth.register_blueprint(users)
 
 
-def get_user(id):
+def get_user(id, profile="admin-detail"):
     try:
         id = uuid.UUID(id)
     except ValueError:
         abort(404)
 
-    users = get_users()
+    users = get_users(profile=profile)
     return users.filter(User.id == id).first_or_404()
 
 
-def get_users():
-    return User.query
+def get_users(profile="admin-table"):
+    return User.query.with_profile(profile)
 
 
 def get_audit_event(id, user_id=None):
-    events = get_audit_events(user_id=user_id)
+    events = get_audit_events(user_id=user_id, profile="admin-detail")
 
     events = events.filter(AuditEvent.id == id)
 
     return events.one_or_404()
 
 
-def get_audit_events(user_id=None):
-    events = AuditEvent.query
+def get_audit_events(user_id=None, profile="admin-table"):
+    events = AuditEvent.query.with_profile(profile)
 
     if user_id:
         events = events.filter(
@@ -72,6 +73,11 @@ def get_audit_events(user_id=None):
     return events
 
 
+def prefetch_locations(events):
+    """Look up the IP addresses of a page of audit events in one batch."""
+    get_results(event.remote_addr for event in events.items)
+
+
 class UserForm(FlaskForm):
     name_first = fields.StringField("First name", validators=(DataRequired(),))
     name_last = fields.StringField("Last name", validators=(DataRequired(),))
@@ -125,6 +131,7 @@ def audit_events(user_id):
         )
 
     events = apply_paged_pagination(events)
+    prefetch_locations(events)
 
     return render_template("admin/auth/audit-events.html", events=events, user=user)
 
@@ -280,6 +287,7 @@ def read_user(id):
 
     events = get_audit_events(user_id=user.id)
     events = apply_paged_pagination(events)
+    prefetch_locations(events)
 
     return render_template("admin/auth/user.html", form=form, events=events, user=user)
 
@@ -298,5 +306,6 @@ def update_user(id=None):
 
     events = get_audit_events(user_id=user.id)
     events = apply_paged_pagination(events)
+    prefetch_locations(events)
 
     return render_template("admin/auth/user.html", form=form, events=events, user=user)
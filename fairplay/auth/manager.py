@@ -1,9 +1,16 @@
 import uuid
 
+from flask import current_app
 from flask_login import LoginManager
 
+from ..cache import near_cache
 from ..db import db
-from .models import AnonymousUser, User
+from .models import (
+    AnonymousUser,
+    User,
+    get_cache_key_for_user_id,
+    get_tz_cache_key_for_user_id,
+)
 
 
 login_manager = LoginManager()
@@ -18,4 +25,22 @@ def user_loader(user_id):
     except ValueError:
         return
 
-    return db.session.get(User, user_id)
+    cache_key = get_cache_key_for_user_id(user_id)
+    tz_cache_key = get_tz_cache_key_for_user_id(user_id)
+
+    # the current timezone is read in the same round trip as the user
+    state, tz = near_cache.get_many(cache_key, tz_cache_key)
+    if state:
+        user = User.from_cached_state(state)
+        user._current_tz = tz
+        return user
+
+    user = db.session.get(User, user_id)
+
+    if user:
+        user._current_tz = tz
+
+        ttl = current_app.config.get("AUTH_USER_CACHE_SECONDS", 300)
+        near_cache.set(cache_key, user.get_cached_state(), ttl)
+
+    return user
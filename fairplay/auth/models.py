@@ -2,19 +2,23 @@ import sqlalchemy as sa
 import sqlalchemy.orm as orm
 import sqlalchemy_utils
 
-from flask import current_app
 from flask_login import AnonymousUserMixin, UserMixin
 from marshmallow import fields
 from marshmallow_sqlalchemy import SQLAlchemySchema
-from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import INET
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from ..audit import audit, audit_record_changes
-from ..cache import cache
-from ..db import BaseModel
+from ..cache import near_cache
+from ..db import BaseModel, db, invalidate_resource_cache_rows
 from ..i18n import _, get_locale, get_timezone
-from ..utils.passlib import get_passlib_context
+from ..utils.geoip import get_location
+from ..utils.passlib import (
+    dummy_verify,
+    get_passlib_context,
+    hash_password,
+    verify_and_update_password,
+)
 
 
 class AnonymousUser(AnonymousUserMixin):
@@ -87,6 +91,12 @@ class User(BaseModel, UserMixin):
         sqlalchemy_utils.IPAddressType().with_variant(INET, "postgresql"),
     )
 
+    # users are cached for user_loader, so disabling them in bulk logs them out
+    cache_bulk_changes = True
+
+    # password hashes are kept out of the cache and only loaded to log in
+    cache_excluded_columns = ("_password",)
+
     __table_args__ = (
         sa.Index(
             "ix_users_email",
@@ -123,12 +133,13 @@ class User(BaseModel, UserMixin):
         return [(cls._active, value)]
 
     def check_password(self, password):
-        ctx = get_passlib_context()
-        verified, update = ctx.verify_and_update(
+        verified, update = verify_and_update_password(
             password, self._password, category="user"
         )
 
         if update:
+            ctx = get_passlib_context()
+
             audit(
                 "security",
                 "updated_password",
@@ -146,8 +157,7 @@ class User(BaseModel, UserMixin):
 
     @classmethod
     def dummy_verify(cls):
-        ctx = get_passlib_context()
-        ctx.dummy_verify()
+        dummy_verify()
 
     @hybrid_property
     def email(self):
@@ -179,8 +189,33 @@ class User(BaseModel, UserMixin):
     def get_cache_key(self):
         return get_cache_key_for_user(self)
 
+    @classmethod
+    def update_last_login_location(cls, id, remote_addr):
+        """Set the last login location from the GeoIP result for an address."""
+        location = get_location(remote_addr)
+
+        statement = sa.update(cls).where(
+            cls.id == id, cls.last_login_remote_addr == remote_addr
+        )
+        statement = statement.values(last_login_location=location)
+
+        rows = db.session.execute(statement.returning(*cls.get_identity_columns()))
+        invalidate_resource_cache_rows(cls, rows, db.session())
+
+        db.session.commit()
+
+    def get_resource_cache_keys(self):
+        return {*super().get_resource_cache_keys(), self.get_cache_key()}
+
+    @classmethod
+    def get_row_cache_keys(cls, values):
+        # bulk updates, e.g. disabling users, must also clear the logged in user
+        keys = super().get_row_cache_keys(values)
+        keys.add(get_cache_key_for_user_id(values["id"]))
+        return keys
+
     def get_tz_cache_key(self):
-        return f"i18n.user-timezone:{self.id}"
+        return get_tz_cache_key_for_user_id(self.id)
 
     @property
     def is_active(self):
@@ -208,8 +243,7 @@ class User(BaseModel, UserMixin):
 
     @password.update_expression  # type: ignore[no-redef]
     def password(cls, value):
-        ctx = get_passlib_context()
-        hash = ctx.hash(value, category="user")
+        hash = hash_password(value, category="user")
         return [(cls._password, hash)]
 
     @property
@@ -226,13 +260,15 @@ class User(BaseModel, UserMixin):
         return f"{base_mailbox}@{domain}".lower()
 
     def set_password(self, password):
-        ctx = get_passlib_context()
-        self._password = ctx.hash(password, category="user")
+        self._password = hash_password(password, category="user")
 
     @hybrid_property
     def tz(self):
-        cache_key = self.get_tz_cache_key()
-        value = cache.get(cache_key)
+        # usually fetched along with the cached user, see ``user_loader``
+        try:
+            value = self._current_tz
+        except AttributeError:
+            value = self._current_tz = near_cache.get(self.get_tz_cache_key())
 
         if not value:
             value = self.default_tz
@@ -246,7 +282,9 @@ class User(BaseModel, UserMixin):
     @tz.setter  # type: ignore[no-redef]
     def tz(self, value):
         cache_key = self.get_tz_cache_key()
-        cache.set(cache_key, value, 86400 * 3)
+        near_cache.set(cache_key, value, 86400 * 3)
+
+        self._current_tz = value
 
     @tz.update_expression  # type: ignore[no-redef]
     def tz(cls, value):
@@ -271,17 +309,8 @@ def get_cache_key_for_user_id(user_id):
     return f"auth.models.user:{user_id}"
 
 
-def invalidate_user_cache(mapper, connection, target):
-    current_app.logger.info(
-        "Invalidate cache for user %s",
-        target.id,
-        extra={"category": "cache"},
-    )
-    cache_key = get_cache_key_for_user(target)
-    cache.delete(cache_key)
-
-
-event.listen(User, "after_update", invalidate_user_cache)
+def get_tz_cache_key_for_user_id(user_id):
+    return f"i18n.user-timezone:{user_id}"
 
 
 class UserAuditSchema(SQLAlchemySchema):
@@ -1,5 +1,3 @@
-import sqlalchemy as sa
-
 from flask import Blueprint, flash, render_template, request, session
 from flask_wtf import FlaskForm
 from flask_wtf.recaptcha import RecaptchaField
@@ -11,8 +9,8 @@ from .models import User
 from ..audit import audit
 from ..db import db
 from ..i18n import _, get_locale, get_timezone
+from ..utils.background import run_in_background
 from ..utils.datetime import aware_datetime
-from ..utils.geoip import get_location
 from ..utils.htmx import HTMX_TRUE, htmx_request
 from ..utils.security import is_safe_url, safe_redirect
 
@@ -52,12 +50,10 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter(
-            sa.or_(
-                User.email == form.email.data,
-                User.sanitized_email == form.email.data,
-            )
-        ).first()
+        user = None
+        if "@" in form.email.data:
+            email = User.sanitize_email(form.email.data)
+            user = User.query.filter(User.sanitized_email == email).first()
 
         if user and user.check_password(form.password.data):
             if not login_user(user):
@@ -66,11 +62,15 @@ def login():
             audit("security", "login", "User account logged in", record=user)
 
             user.last_login_date = aware_datetime()
-            user.last_login_location = get_location(request.remote_addr)
             user.last_login_remote_addr = request.remote_addr
 
+            # a rehashed password, the audit events and these are all one flush
             db.session.commit()
 
+            run_in_background(
+                User.update_last_login_location, user.id, request.remote_addr
+            )
+
             return safe_redirect(next)
         elif not user:
             User.dummy_verify()
@@ -0,0 +1,299 @@
+"""Benchmarks for the hot paths of the application."""
+import collections
+import concurrent.futures
+import datetime as dt
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+
+import click
+import sqlalchemy as sa
+
+from flask import current_app
+from flask.cli import AppGroup
+from passlib.context import CryptContext
+from sqlalchemy import event
+
+from . import __version__
+from .auth.models import User
+from .courses.models import Course, CourseHole
+from .db import db
+from .games.models import Game, GameHole
+from .players.models import Player
+from .seed import seed_command
+from .utils.passlib import get_passlib_context
+
+
+benchmark_cli = AppGroup("benchmark", help="Run benchmarks.")
+
+
+def _measure(f, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _echo_timings(label, timings):
+    median = statistics.median(timings) * 1000
+    fastest = min(timings) * 1000
+    click.echo(f"{label:<24} {median:>10.3f} ms {fastest:>10.3f} ms")
+
+
+def _get_percentiles(timings):
+    if len(timings) > 1:
+        quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+        return [quantiles[i] * 1000 for i in (49, 94, 98)]
+
+    return [timings[0] * 1000] * 3
+
+
+def _get_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return
+
+
+def _get_samples(size):
+    def sample(*columns):
+        statement = sa.select(*columns).limit(size)
+        return db.session.execute(statement).all()
+
+    return {
+        "courses": sample(Course.id),
+        "course_holes": sample(CourseHole.course_id, CourseHole.number),
+        "games": sample(Game.id),
+        "game_holes": sample(GameHole.game_id, GameHole.number),
+        "players": sample(Player.id),
+    }
+
+
+def _get_api_endpoints(samples):
+    """Return the requests to benchmark, as functions that pick a URL and headers."""
+    endpoints = {}
+
+    def add(name, rows, make_url):
+        if rows:
+            endpoints[name] = lambda rng: (make_url(rng.choice(rows)), {})
+
+    endpoints["courses"] = lambda rng: ("/api/v1/courses", {})
+    endpoints["games"] = lambda rng: ("/api/v1/games", {})
+    endpoints["players"] = lambda rng: ("/api/v1/players", {})
+
+    add("course", samples["courses"], lambda r: f"/api/v1/courses/{r.id}")
+    add("game", samples["games"], lambda r: f"/api/v1/games/{r.id}")
+    add("player", samples["players"], lambda r: f"/api/v1/players/{r.id}")
+
+    add(
+        "course holes",
+        samples["courses"],
+        lambda r: f"/api/v1/courses/{r.id}/holes",
+    )
+    add(
+        "course hole",
+        samples["course_holes"],
+        lambda r: f"/api/v1/courses/{r.course_id}/holes/{r.number}",
+    )
+    add(
+        "game hole",
+        samples["game_holes"],
+        lambda r: f"/api/v1/games/{r.game_id}/holes/{r.number}",
+    )
+
+    return endpoints
+
+
+def _get_conditional_endpoint(client, samples):
+    """Return a request for a course the client already has, which should be 304."""
+    etags = []
+    for row in samples["courses"]:
+        url = f"/api/v1/courses/{row.id}"
+        response = client.get(url)
+        if response.status_code == 200 and response.headers.get("ETag"):
+            etags.append((url, {"If-None-Match": response.headers["ETag"]}))
+
+    if etags:
+        return lambda rng: rng.choice(etags)
+
+
+def _run_endpoint(app, make_request, requests, concurrency, seed):
+    queries = threading.local()
+
+    def count_query(*args):
+        queries.count = getattr(queries, "count", 0) + 1
+
+    def worker(n, worker_seed):
+        client = app.test_client()
+        rng = random.Random(worker_seed)
+
+        results = []
+        for _ in range(n):
+            url, headers = make_request(rng)
+
+            queries.count = 0
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            elapsed = time.perf_counter() - start
+
+            results.append((elapsed, response.status_code, queries.count))
+
+        return results
+
+    # spread the requests over the workers, the first ones taking any remainder
+    shares = [
+        requests // concurrency + (i < requests % concurrency)
+        for i in range(concurrency)
+    ]
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", count_query)
+    try:
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            futures = [
+                executor.submit(worker, n, f"{seed}:{i}")
+                for i, n in enumerate(shares)
+                if n
+            ]
+            results = [r for future in futures for r in future.result()]
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, "before_cursor_execute", count_query)
+
+    timings = [timing for timing, _, _ in results]
+    p50, p95, p99 = _get_percentiles(timings)
+
+    return {
+        "requests": len(results),
+        "throughput": len(results) / elapsed,
+        "latency_p50": p50,
+        "latency_p95": p95,
+        "latency_p99": p99,
+        "queries": statistics.mean(count for _, _, count in results),
+        "statuses": dict(collections.Counter(str(status) for _, status, _ in results)),
+    }
+
+
+@benchmark_cli.command("login")
+@click.option("--iterations", default=20, help="Number of times to run each step.")
+@click.option("--password", default="correct horse battery staple")
+def login_command(iterations, password):
+    """Time checking a password to log in, apart from the hash itself."""
+    ctx = get_passlib_context()
+
+    user = User(name_first="Benchmark", name_last="User", email="bench@example.com")
+    user.set_password(password)
+
+    handler = ctx.handler(category="user")
+    password_hash = user._password
+
+    def build_context():
+        CryptContext.from_string(ctx.to_string())
+
+    timings = {
+        "build context": _measure(build_context, iterations),
+        "get context": _measure(get_passlib_context, iterations),
+        "check password": _measure(lambda: user.check_password(password), iterations),
+        "hash": _measure(lambda: handler.verify(password, password_hash), iterations),
+    }
+
+    click.echo(f"{'step':<24} {'median':>13} {'fastest':>13}")
+    for label, step_timings in timings.items():
+        _echo_timings(label, step_timings)
+
+    overhead = [
+        check - hash for check, hash in zip(timings["check password"], timings["hash"])
+    ]
+    _echo_timings("outside hash", overhead)
+
+
+@benchmark_cli.command("api")
+@click.option("--requests", default=200, help="Number of requests per endpoint.")
+@click.option("--concurrency", default=4, help="Number of concurrent clients.")
+@click.option("--endpoint", "endpoints", multiple=True, help="Only run an endpoint.")
+@click.option("--seed-courses", default=0, help="Seed this many courses first.")
+@click.option("--sample-size", default=100, help="Number of rows to pick ids from.")
+@click.option("--seed", default=0, help="Seed for the order of requests.")
+@click.option(
+    "--output", type=click.Path(dir_okay=False, writable=True), help="Save as JSON."
+)
+def api_command(
+    requests, concurrency, endpoints, seed_courses, sample_size, seed, output
+):
+    """Time the API endpoints, with ids picked from the database.
+
+    Requests go through the test client, so this measures the app and database
+    without any network or server in between. The JSON output can be compared
+    between commits to spot regressions.
+    """
+    if "api" not in current_app.blueprints:
+        raise click.ClickException("The API isn't enabled, add it to EXTENSIONS")
+
+    if seed_courses:
+        click.get_current_context().invoke(seed_command, courses=seed_courses)
+
+    app = current_app._get_current_object()
+
+    samples = _get_samples(sample_size)
+    available = _get_api_endpoints(samples)
+
+    conditional = _get_conditional_endpoint(app.test_client(), samples)
+    if conditional:
+        available["course (conditional)"] = conditional
+
+    if endpoints:
+        unknown = set(endpoints) - set(available)
+        if unknown:
+            raise click.BadParameter(
+                f"unknown or without data: {', '.join(sorted(unknown))}",
+                param_hint="--endpoint",
+            )
+        available = {name: available[name] for name in endpoints}
+
+    # the session of the command's app context shouldn't hold a transaction open
+    db.session.remove()
+
+    results = {}
+
+    click.echo(
+        f"{'endpoint':<24} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+        f"{'queries':>8}  statuses"
+    )
+    for name, make_request in available.items():
+        result = results[name] = _run_endpoint(
+            app, make_request, requests, concurrency, seed
+        )
+
+        statuses = ", ".join(f"{k}: {v}" for k, v in sorted(result["statuses"].items()))
+        click.echo(
+            f"{name:<24} {result['throughput']:>9.1f} "
+            f"{result['latency_p50']:>6.2f} ms {result['latency_p95']:>6.2f} ms "
+            f"{result['latency_p99']:>6.2f} ms {result['queries']:>8.1f}  {statuses}"
+        )
+
+    if output:
+        report = {
+            "concurrency": concurrency,
+            "database": db.engine.dialect.name,
+            "date": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "endpoints": results,
+            "requests": requests,
+            "revision": _get_revision(),
+            "version": __version__,
+        }
+
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        click.echo(f"Saved results to {output}")
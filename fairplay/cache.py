@@ -1,48 +1,164 @@
+import functools
+import hashlib
+import json
+import logging
+import random
+import threading
 import time
+import uuid
+import weakref
 
 from flask import current_app
 from flask_caching import Cache as _Cache
 
+from .utils.background import PerProcess
+
+
+logger = logging.getLogger(__name__)
+
+# a lock per key, which is freed once nothing is waiting on or holding it
+_process_locks = weakref.WeakValueDictionary()
+_process_locks_lock = threading.Lock()
+
 
 class Cache(_Cache):
-    def stale_if_error(self, f=None, cache_key=None, max_stale=None, ttl=None):
-        """Return stale cached result if an error occurs."""
+    def get_lock(self, key, timeout=None):
+        """Return a lock for key, shared between processes if the backend is
+        Redis and otherwise only between threads of this process."""
+        client = getattr(self.cache, "_write_client", None)
+        if client is not None and hasattr(client, "lock"):
+            # released by whichever thread finishes the work
+            return client.lock(
+                f"{self.cache.key_prefix}lock:{key}",
+                timeout=timeout,
+                blocking_timeout=timeout,
+                thread_local=False,
+            )
+
+        with _process_locks_lock:
+            lock = _process_locks.get(key)
+            if lock is None:
+                lock = _process_locks[key] = threading.Lock()
+
+        return lock
+
+    def stale_if_error(
+        self,
+        f=None,
+        cache_key=None,
+        max_stale=None,
+        ttl=None,
+        jitter=0.1,
+    ):
+        """Cache a result and keep serving it while it's refreshed.
+
+        Once a result is older than ``ttl`` it's still returned straight away,
+        while one caller refreshes it in the background. Stale results are
+        kept for another ``max_stale`` seconds, and returned if refreshing
+        fails. Only one caller computes a missing result at a time, and expiry
+        is shortened by up to ``jitter`` so keys don't all expire together.
+
+        Without a ``cache_key`` the key is made from the function's arguments,
+        it can also be a function that's passed them and returns the key.
+        ``ttl`` can be a function that returns it, e.g. from the config, which
+        is called once per app.
+        """
 
         def decorator(f):
-            def wrapper(*args, **kwargs):
-                cache_defaults = current_app.config.get_namespace(
-                    "CACHE_DEFAULT_"
+            app_options = weakref.WeakKeyDictionary()
+
+            def get_options():
+                app = current_app._get_current_object()
+
+                options = app_options.get(app)
+                if options:
+                    return options
+
+                cache_defaults = app.config.get_namespace("CACHE_DEFAULT_")
+
+                timeout = callable(ttl) and ttl() or ttl
+                timeout = timeout or cache_defaults.get("timeout") or 300
+                stale_timeout = (
+                    max_stale or cache_defaults.get("stale_timeout") or timeout
                 )
+                lock_timeout = cache_defaults.get("lock_timeout", 30)
 
-                nonlocal ttl
-                if not ttl:
-                    ttl = cache_defaults["timeout"]
+                options = app_options[app] = (
+                    timeout,
+                    stale_timeout,
+                    lock_timeout,
+                )
+                return options
 
-                cached_value = self.get(cache_key)
-                if cached_value and cached_value["iat"] + ttl < time.time():
-                    return cached_value["value"]
+            def get_key(args, kwargs):
+                if callable(cache_key):
+                    return cache_key(*args, **kwargs)
+                elif cache_key:
+                    return cache_key
 
-                try:
-                    value = f(*args, **kwargs)
-                except Exception:
-                    if cached_value:
-                        current_app.logger.warning(
-                            "Error calling '%s', returning stale result",
+                arguments = repr((args, sorted(kwargs.items())))
+                digest = hashlib.sha1(arguments.encode()).hexdigest()
+                return f"{f.__module__}.{f.__qualname__}:{digest}"
+
+            def refresh(key, args, kwargs):
+                timeout, stale_timeout, _ = get_options()
+
+                value = f(*args, **kwargs)
+
+                expires = timeout * (1 - random.uniform(0, jitter))
+                cached_value = {"exp": time.time() + expires, "value": value}
+                self.set(key, cached_value, timeout + stale_timeout)
+
+                return value
+
+            def revalidate(app, key, lock, args, kwargs):
+                with app.app_context():
+                    try:
+                        refresh(key, args, kwargs)
+                    except Exception:
+                        app.logger.warning(
+                            "Error calling '%s', keeping stale result",
                             f,
                             exc_info=True,
                         )
-                        return cached_value["value"]
-                    raise
+                    finally:
+                        lock.release()
 
-                nonlocal max_stale
-                if not max_stale:
-                    max_stale = cache_defaults["stale_timeout"]
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                _, _, lock_timeout = get_options()
 
-                self.set(
-                    cache_key, {"iat": time.time(), "value": value}, max_stale
-                )
+                key = get_key(args, kwargs)
 
-                return value
+                # values cached before expiry was stored count as expired
+                cached_value = self.get(key)
+                if cached_value and cached_value.get("exp", 0) > time.time():
+                    return cached_value["value"]
+
+                lock = self.get_lock(key, lock_timeout)
+
+                if cached_value:
+                    if lock.acquire(blocking=False):
+                        app = current_app._get_current_object()
+                        threading.Thread(
+                            target=revalidate,
+                            args=(app, key, lock, args, kwargs),
+                            daemon=True,
+                        ).start()
+
+                    return cached_value["value"]
+
+                # wait for anyone else computing it and use their result
+                locked = lock.acquire()
+                try:
+                    cached_value = self.get(key)
+                    if cached_value:
+                        return cached_value["value"]
+
+                    return refresh(key, args, kwargs)
+                finally:
+                    if locked:
+                        lock.release()
 
             return wrapper
 
@@ -53,13 +169,145 @@ cache = shared_cache = Cache()
 worker_cache = Cache()
 
 
+class LayeredCache:
+    """Read through the worker cache and then the shared cache.
+
+    When the shared cache is Redis, every set and delete is published on
+    ``CACHE_NEAR_CHANNEL`` and each worker drops its own copy of those keys,
+    so worker copies can be kept for longer without going stale.
+    """
+
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+
+        self.app = None
+        self.channel = None
+        self.client = None
+        self.local_timeout = None
+
+        self._origin = None
+        self._started = PerProcess(self._start)
+
+    def init_app(self, app):
+        self.app = app
+        self.channel = app.config.get("CACHE_NEAR_CHANNEL", "fairplay.cache")
+
+        backend = app.extensions["cache"][self.remote]
+        client = getattr(backend, "_write_client", None)
+        if client is not None and hasattr(client, "pubsub"):
+            self.client = client
+
+        default_timeout = self.client and 300 or 10
+        self.local_timeout = app.config.get("CACHE_NEAR_TIMEOUT", default_timeout)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+
+                # anything could have changed while we weren't subscribed
+                with self.app.app_context():
+                    self.local.clear()
+
+                for message in pubsub.listen():
+                    origin, keys = json.loads(message["data"])
+                    if origin == self._origin:
+                        continue
+
+                    with self.app.app_context():
+                        self.local.delete_many(*keys)
+            except Exception:
+                logger.exception("Error receiving cache invalidations")
+                time.sleep(1)
+
+    def _publish(self, keys):
+        self._started.get()
+
+        if self.client and keys:
+            message = json.dumps([self._origin, list(keys)])
+            self.client.publish(self.channel, message)
+
+    def _start(self):
+        self._origin = uuid.uuid4().hex
+
+        if self.client:
+            threading.Thread(
+                target=self._listen, name="fairplay-cache", daemon=True
+            ).start()
+
+    def _get_local_timeout(self, timeout, local_timeout):
+        local_timeout = local_timeout or self.local_timeout
+        if timeout:
+            return min(timeout, local_timeout)
+        return local_timeout
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        self.remote.delete_many(*keys)
+        self.local.delete_many(*keys)
+        self._publish(keys)
+
+    def get(self, key, local_timeout=None):
+        self._started.get()
+
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        value = self.remote.get(key)
+        if value is not None:
+            self.local.set(key, value, local_timeout or self.local_timeout)
+
+        return value
+
+    def get_many(self, *keys, local_timeout=None):
+        self._started.get()
+
+        values = dict(zip(keys, self.local.get_many(*keys)))
+
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            found = {
+                key: value
+                for key, value in zip(missing, self.remote.get_many(*missing))
+                if value is not None
+            }
+            if found:
+                self.local.set_many(found, local_timeout or self.local_timeout)
+                values.update(found)
+
+        return [values[key] for key in keys]
+
+    def set(self, key, value, timeout=None, local_timeout=None):
+        return self.set_many({key: value}, timeout, local_timeout)
+
+    def set_many(self, mapping, timeout=None, local_timeout=None):
+        self.remote.set_many(mapping, timeout)
+        self.local.set_many(mapping, self._get_local_timeout(timeout, local_timeout))
+        self._publish(mapping)
+
+
+near_cache = LayeredCache(worker_cache, shared_cache)
+
+
 def init_cache(app):
     if app.config.get("CACHE_TYPE") == "RedisCache":
         app.config.setdefault("CACHE_REDIS_URL", app.config.get("REDIS_URL"))
 
+    # otherwise delete_many stops at the first key that isn't cached
+    app.config.setdefault("CACHE_IGNORE_ERRORS", True)
+
     shared_cache.init_app(app)
 
-    worker_config = app.config.get_namespace("CACHE_WORKER_")
-    worker_config.setdefault("cache_type", "SimpleCache")
+    # flask-caching reads upper-case keys and falls back to the app config
+    worker_config = app.config.get_namespace("CACHE_WORKER_", lowercase=False)
+    worker_config = {f"CACHE_{k}": v for k, v in worker_config.items()}
+    worker_config.setdefault("CACHE_TYPE", "SimpleCache")
 
     worker_cache.init_app(app, worker_config)
+
+    near_cache.init_app(app)
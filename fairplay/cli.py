@@ -11,6 +11,8 @@ from werkzeug import __version__ as werkzeug_version
 
 from . import __version__
 from .app import create_app
+from .benchmark import benchmark_cli
+from .seed import seed_command
 
 
 def get_version(ctx, param, value):  # pragma: nocover
@@ -44,6 +46,9 @@ def cli():
 dynaconf.help = "Manage configuration."
 cli.add_command(dynaconf, "config")
 
+cli.add_command(benchmark_cli)
+cli.add_command(seed_command)
+
 
 def main(as_module=False):  # pragma: nocover
     prog_name = as_module and "python -m fairplay" or sys.argv[0]
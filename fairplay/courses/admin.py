@@ -27,18 +27,18 @@ def init_app(app):
     admin.register_blueprint(courses)
 
 
-def get_course(id):
+def get_course(id, profile="admin-detail"):
     try:
         id = uuid.UUID(id)
     except ValueError:
         abort(404)
 
-    courses = get_courses()
+    courses = get_courses(profile=profile)
     return db.one_or_404(courses.filter(Course.id == id))
 
 
-def get_courses():
-    return Course.query.filter_by_current_user()
+def get_courses(profile="admin-table"):
+    return Course.query.filter_by_current_user().with_profile(profile)
 
 
 class CoordiateField(fields.FormField):
@@ -171,16 +171,15 @@ holes = Blueprint(
 courses.register_blueprint(holes)
 
 
-def get_hole(course_id, number):
-    holes = get_holes(course_id)
+def get_hole(course_id, number, profile="admin-detail"):
+    holes = get_holes(course_id, profile=profile)
     return db.one_or_404(holes.filter(CourseHole.number == number))
 
 
-def get_holes(course_id):
+def get_holes(course_id, profile="admin-table"):
     course = get_course(course_id)
-    return CourseHole.query.filter(CourseHole.course == course).order_by(
-        CourseHole.number
-    )
+    holes = CourseHole.query.filter(CourseHole.course == course).with_profile(profile)
+    return holes.order_by(CourseHole.number)
 
 
 class CourseHoleForm(FlaskForm):
@@ -267,7 +266,7 @@ def read_hole(course_id, number):
 
         flash(_("Hole updated"), "success")
 
-    features = CourseFeature.query.filter(CourseFeature.hole == hole)
+    features = get_features(hole.id)
     features = apply_paged_pagination(features)
 
     return render_template(
@@ -295,11 +294,13 @@ holes.register_blueprint(features)
 
 def get_feature(course_id, number, id):
     hole = get_hole(course_id, number)
-    return db.one_or_404(get_features(hole.id).filter(CourseFeature.id == id))
+    features = get_features(hole.id, profile="admin-detail")
+    return db.one_or_404(features.filter(CourseFeature.id == id))
 
 
-def get_features(hole_id):
-    return CourseFeature.query.filter(CourseFeature.hole_id == hole_id)
+def get_features(hole_id, profile="admin-table"):
+    features = CourseFeature.query.filter(CourseFeature.hole_id == hole_id)
+    return features.with_profile(profile)
 
 
 class CourseFeatureForm(FlaskForm):
@@ -369,7 +370,7 @@ def delete_feature(course_id, number, id=None):
 @features.route("", endpoint="list", methods=["GET"])
 def list_features(course_id, number):
     hole = get_hole(course_id, number)
-    features = CourseFeature.query.filter(CourseFeature.hole == hole)
+    features = get_features(hole.id)
 
     features = apply_paged_pagination(features)
 
@@ -1,17 +1,25 @@
 from flask import Blueprint, request, url_for
+from geoalchemy2 import WKTElement
 from marshmallow import ValidationError, fields, validate
 from marshmallow_sqlalchemy import SQLAlchemySchema
 
 from ..api.v1 import Coordinates, v1
+from ..api.utils.batch import (
+    bulk_create,
+    bulk_delete,
+    bulk_update,
+    get_batch_data,
+    validate_unique,
+)
+from ..api.utils.caching import get_cached_resource, make_resource_response
 from ..api.utils.conditional import (
     add_etag_header,
     add_last_modified_header,
     check_if_match,
-    check_if_modified_since,
-    check_if_none_match,
     check_if_unmodified_since,
 )
-from ..api.utils.pagination import apply_paged_pagination
+from ..api.utils.pagination import apply_pagination
+from ..api.utils.serialization import dump_rows, with_schema_columns
 from ..db import db
 from .models import Course, CourseHole
 
@@ -34,8 +42,8 @@ class CourseSchema(SQLAlchemySchema):
     pos = fields.Nested(Coordinates)
 
 
-def get_courses():
-    return Course.query
+def get_courses(profile="api-detail"):
+    return Course.query.with_profile(profile)
 
 
 def get_course(id):
@@ -44,6 +52,10 @@ def get_course(id):
     return db.one_or_404(courses.filter(Course.id == id))
 
 
+def to_point(pos):
+    return WKTElement(f"POINT({pos['lon']} {pos['lat']})", srid=4326)
+
+
 def validate_course(id):
     valid = db.session.query(
         Course.query.filter_by_current_user().filter(Course.id == id).exists()
@@ -86,27 +98,23 @@ def delete(id):
 
 @courses.route("", methods=["GET"])
 def list():
-    courses = get_courses()
-
-    courses = apply_paged_pagination(courses)
+    courses = get_courses(profile="api-list")
 
     schema = CourseSchema()
-    return schema.dump(courses, many=True)
+
+    courses = with_schema_columns(courses, schema, Course.created_date)
+    courses = apply_pagination(courses, Course.created_date, Course.id)
+
+    return dump_rows(schema, courses)
 
 
 @courses.route("/<id>", methods=["GET"])
 def read(id):
-    course = get_course(id)
-
     schema = CourseSchema()
 
-    add_etag_header(course, schema)
-    add_last_modified_header(course)
+    course = get_cached_resource(Course, schema, lambda: get_course(id), id=id)
 
-    check_if_modified_since(course)
-    check_if_none_match(course, schema)
-
-    return schema.dump(course)
+    return make_resource_response(course)
 
 
 @courses.route("/<id>", methods=["POST"])
@@ -149,8 +157,8 @@ class CourseHoleSchema(SQLAlchemySchema):
     course_id = fields.UUID(required=True)
 
 
-def get_course_holes(course_id=None):
-    holes = CourseHole.query
+def get_course_holes(course_id=None, profile="api-detail"):
+    holes = CourseHole.query.with_profile(profile)
 
     if course_id:
         holes = holes.filter(CourseHole.course_id == course_id)
@@ -207,6 +215,77 @@ def create_hole(course_id=None, number=None):
     return schema.dump(hole), headers, 201
 
 
+@holes.route("/<course_id>/holes/batch", endpoint="create_batch", methods=["POST"])
+def create_holes(course_id):
+    course = get_course(course_id)
+
+    schema = CourseHoleSchema(many=True, load_instance=False, exclude=("course_id",))
+    data = schema.load(get_batch_data())
+
+    validate_unique(data, "number")
+
+    for hole in data:
+        hole["course_id"] = course.id
+
+        if "pos" in hole:
+            hole["pos"] = to_point(hole["pos"])
+        else:
+            hole["pos"] = course.pos
+
+    holes = bulk_create(CourseHole, data)
+
+    Course.update_hole_count(course.id)
+
+    db.session.commit()
+
+    schema = CourseHoleSchema(many=True)
+    return schema.dump(holes), 201
+
+
+@holes.route("/<course_id>/holes/batch", endpoint="delete_batch", methods=["DELETE"])
+def delete_holes(course_id):
+    course = get_course(course_id)
+
+    numbers = fields.List(fields.Integer(), required=True)
+    numbers = numbers.deserialize(get_batch_data())
+
+    bulk_delete(
+        CourseHole, CourseHole.course_id == course.id, CourseHole.number.in_(numbers)
+    )
+
+    Course.update_hole_count(course.id)
+
+    db.session.commit()
+
+    return "", 204
+
+
+@holes.route("/<course_id>/holes/batch", endpoint="update_batch", methods=["PATCH"])
+def update_holes(course_id):
+    course = get_course(course_id)
+
+    schema = CourseHoleSchema(
+        many=True, load_instance=False, exclude=("course_id",), partial=True
+    )
+    data = schema.load(get_batch_data())
+
+    validate_unique(data, "number")
+
+    for hole in data:
+        if "pos" in hole:
+            hole["pos"] = to_point(hole["pos"])
+
+    ids = bulk_update(CourseHole, data, CourseHole.course_id == course.id, key="number")
+
+    db.session.commit()
+
+    holes = get_course_holes(course_id=course.id).filter(CourseHole.id.in_(ids))
+    holes = holes.order_by(CourseHole.number)
+
+    schema = CourseHoleSchema(many=True)
+    return schema.dump(holes)
+
+
 @holes.route("/holes/<id>", endpoint="delete", methods=["DELETE"])
 @holes.route("/<course_id>/holes/<number>", endpoint="delete", methods=["DELETE"])
 def delete_hole(course_id=None, id=None, number=None):
@@ -224,28 +303,34 @@ def delete_hole(course_id=None, id=None, number=None):
 @holes.route("/holes", endpoint="list", methods=["GET"])
 @holes.route("/<course_id>/holes", endpoint="list", methods=["GET"])
 def list_holes(course_id=None):
-    holes = get_course_holes(course_id=course_id)
-
-    holes = apply_paged_pagination(holes)
+    holes = get_course_holes(course_id=course_id, profile="api-list")
 
     schema = CourseHoleSchema()
-    return schema.dump(holes, many=True)
+
+    holes = with_schema_columns(holes, schema, CourseHole.created_date)
+    holes = apply_pagination(holes, CourseHole.created_date, CourseHole.id)
+
+    return dump_rows(schema, holes)
 
 
 @holes.route("/holes/<id>", endpoint="read", methods=["GET"])
 @holes.route("/<course_id>/holes/<number>", endpoint="read", methods=["GET"])
 def read_hole(course_id=None, id=None, number=None):
-    hole = get_course_hole(course_id=course_id, id=id, number=number)
-
     schema = CourseHoleSchema()
 
-    add_etag_header(hole, schema)
-    add_last_modified_header(hole)
+    if id:
+        identity = {"id": id}
+    else:
+        identity = {"course_id": course_id, "number": number}
 
-    check_if_modified_since(hole)
-    check_if_none_match(hole, schema)
+    hole = get_cached_resource(
+        CourseHole,
+        schema,
+        lambda: get_course_hole(course_id=course_id, id=id, number=number),
+        **identity,
+    )
 
-    return schema.dump(hole)
+    return make_resource_response(hole)
 
 
 @holes.route("/holes/<id>", endpoint="update", methods=["POST"])
@@ -3,26 +3,31 @@ import sqlalchemy as sa
 import sqlalchemy.orm as orm
 import sqlalchemy_utils
 
-from flask import session, url_for
+from flask import g, session, url_for
 from werkzeug.local import LocalProxy
 
 from ..auth import current_user
-from ..db import BaseModel, BaseQuery, db
+from ..db import BaseModel, BaseQuery, db, invalidate_resource_cache_rows
 from ..i18n import _
 
 
 def get_current_course():
+    if "current_course" in g:
+        return g.current_course
+
     course = None
     course_id = session.get("course_id")
 
     if course_id:
-        course = db.session.get(Course, course_id)
+        course = Course.get_cached(course_id)
 
     if not course:
         course = Course.query.filter_by_current_user().first()
         if course:
             session["course_id"] = str(course.id)
 
+    g.current_course = course
+
     return course
 
 
@@ -61,6 +66,8 @@ class Course(BaseModel):
 
     query_class = CourseQuery
 
+    cache_bulk_changes = True
+
     __table_args__ = (
         sa.Index(
             "ix_course_hole_count", hole_count.column, postgresql_where="hole_count > 0"
@@ -84,6 +91,25 @@ class Course(BaseModel):
         anchor = self.name.lstrip()[0].lower()
         return url_for("static", filename="img/profile.svg", _anchor=anchor)
 
+    @classmethod
+    def update_hole_count(cls, *ids):
+        """Recompute the aggregated hole count, e.g. after bulk changes to holes."""
+        table = cls.__table__
+        holes = CourseHole.__table__
+
+        hole_count = (
+            sa.select(sa.func.count(holes.c.number))
+            .where(holes.c.course_id == table.c.id)
+            .scalar_subquery()
+        )
+
+        statement = sa.update(table).where(table.c.id.in_(ids))
+        statement = statement.values(hole_count=hole_count)
+
+        # the cached course and its ETag are stale once the count changes
+        rows = db.session.execute(statement.returning(*cls.get_identity_columns()))
+        invalidate_resource_cache_rows(cls, rows, db.session())
+
 
 class CourseHole(BaseModel):
     __tablename__ = "course_hole"
@@ -101,10 +127,19 @@ class CourseHole(BaseModel):
         nullable=False,
     )
 
-    course = orm.relationship("Course", lazy="joined", back_populates="holes")
+    course = orm.relationship("Course", back_populates="holes")
     features = orm.relationship("CourseFeature", back_populates="hole")
     games = orm.relationship("GameHole", lazy="dynamic", back_populates="hole")
 
+    cache_bulk_changes = True
+    cache_identities = (("id",), ("course_id", "number"))
+    cache_parents = ("course",)
+
+    load_profiles = {
+        **BaseModel.load_profiles,
+        "admin-detail": {"*": "select", "course": "joined", "course.holes": "selectin"},
+    }
+
     __table_args__ = (
         sa.CheckConstraint("number > 0", "ck_course_hole_positive"),
         sa.CheckConstraint(
@@ -156,7 +191,17 @@ class CourseFeature(BaseModel):
         nullable=False,
     )
 
-    hole = orm.relationship("CourseHole", lazy="joined", back_populates="features")
+    hole = orm.relationship("CourseHole", back_populates="features")
+
+    load_profiles = {
+        **BaseModel.load_profiles,
+        "admin-detail": {
+            "*": "select",
+            "hole": "joined",
+            "hole.course": "joined",
+            "hole.features": "selectin",
+        },
+    }
 
     __table_args__ = (
         sa.Index("ix_course_feature_hole_id", hole_id),
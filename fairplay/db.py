@@ -1,22 +1,62 @@
 import uuid
 
 import sqlalchemy as sa
+import sqlalchemy.orm as orm
 import sqlalchemy_utils
 
+from flask import current_app
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from flask_sqlalchemy.query import Query as BaseQuery
+from flask_sqlalchemy.query import Query
+from sqlalchemy import event
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
 from sqlalchemy.sql.functions import FunctionElement
 from sqlalchemy_utils import force_instant_defaults
 
+from .cache import near_cache
 from .utils.datetime import aware_datetime
 
 
 __all__ = ["BaseModel", "BaseQuery", "db"]
 
 
-db = SQLAlchemy()
+LOADER_STRATEGIES = {
+    "joined": "joinedload",
+    "raise": "raiseload",
+    "select": "lazyload",
+    "selectin": "selectinload",
+}
+
+
+class BaseQuery(Query):
+    def delete(self, *args, **kwargs):
+        """Delete the matching rows, clearing their cached resources first."""
+        self._invalidate_resource_cache()
+        return super().delete(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        """Update the matching rows, clearing their cached resources first."""
+        self._invalidate_resource_cache()
+        return super().update(*args, **kwargs)
+
+    def with_profile(self, profile):
+        """Apply the loader strategies of a named load profile of the queried model."""
+        model = self.column_descriptions[0]["entity"]
+        return self.options(*model.get_load_options(profile))
+
+    def _invalidate_resource_cache(self):
+        # bulk statements don't fire the mapper events that clear the cache
+        model = self.column_descriptions[0]["entity"]
+        if not issubclass(model, BaseModel) or not model.cache_bulk_changes:
+            return
+
+        criteria = [] if self.whereclause is None else [self.whereclause]
+        invalidate_resource_cache_where(model, *criteria, session=self.session)
+
+
+db = SQLAlchemy(query_class=BaseQuery)
 
 migrate = Migrate()
 
@@ -67,6 +107,20 @@ def compile_secret_postgresql(element, compiler, **kwargs):
     return f"lower(encode(gen_random_bytes({element.length}), 'hex'))"
 
 
+class Explain(Executable, ClauseElement):
+    """Return the planner's query plan for a statement as JSON."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain_postgresql(element, compiler, **kwargs):
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kwargs)}"
+
+
 UUID = sqlalchemy_utils.UUIDType()
 
 
@@ -97,6 +151,283 @@ class BaseModel(db.Model):
         nullable=False,
     )
 
+    version = sa.Column(sa.Integer, default=1, server_default="1", nullable=False)
+
+    @orm.declared_attr
+    def __mapper_args__(cls):
+        # updates are issued as "UPDATE ... WHERE id = ? AND version = ?" and raise
+        # StaleDataError if the row was changed since it was loaded
+        return {"version_id_col": cls.version}
+
+    # columns left out of cached state, they're loaded if they're accessed
+    cache_excluded_columns = ()
+
+    # whether rows are cached, e.g. as API resources, so bulk updates and deletes
+    # look up the rows they change first to clear them, which other models skip
+    cache_bulk_changes = False
+
+    # sets of columns that identify a single row, used for resource cache keys
+    cache_identities = (("id",),)
+
+    # many-to-one relationships to rows that aggregate this one, e.g. a count of
+    # children, which are invalidated along with it; parents are looked up by id
+    cache_parents = ()
+
+    # relationships aren't eagerly loaded by default, instead queries pick a profile
+    # that maps relationship paths to a loader strategy in ``LOADER_STRATEGIES``
+    load_profiles = {
+        "admin-detail": {"*": "select"},
+        "admin-table": {"*": "select"},
+        "api-detail": {"*": "select"},
+        "api-list": {"*": "raise"},
+    }
+
+    @classmethod
+    def get_load_options(cls, profile):
+        try:
+            strategies = cls.load_profiles[profile]
+        except KeyError:
+            raise ValueError(f"Unknown load profile '{profile}' for {cls.__name__}")
+
+        options = []
+        for path, strategy in strategies.items():
+            strategy = LOADER_STRATEGIES[strategy]
+
+            if path == "*":
+                options.append(getattr(orm, strategy)("*"))
+                continue
+
+            # intermediate relationships keep the strategy set by their own path
+            *parents, name = path.split(".")
+            model = cls
+            option = orm
+            for parent in parents:
+                attr = getattr(model, parent)
+                option = option.defaultload(attr)
+                model = attr.property.mapper.class_
+
+            options.append(getattr(option, strategy)(getattr(model, name)))
+
+        return options
+
+    @classmethod
+    def from_cached_state(cls, state):
+        """Return a row in the session from :meth:`get_cached_state` without a query."""
+        dialect = db.engine.dialect
+        mapper = sa.inspect(cls)
+
+        obj = mapper.class_manager.new_instance()
+        for key, value in state.items():
+            column_type = mapper.column_attrs[key].columns[0].type
+            if isinstance(column_type, sa.types.TypeDecorator):
+                value = column_type.process_result_value(value, dialect)
+            orm.attributes.set_committed_value(obj, key, value)
+
+        orm.make_transient_to_detached(obj)
+
+        return db.session.merge(obj, load=False)
+
+    def get_cached_state(self):
+        """Return the column values of this row in a form that can be cached.
+
+        Custom column types are stored as their database values, so the state can be
+        pickled whatever the type returns.
+        """
+        dialect = db.engine.dialect
+
+        state = {}
+        for attr in sa.inspect(type(self)).column_attrs:
+            if attr.key in self.cache_excluded_columns:
+                continue
+
+            value = getattr(self, attr.key)
+            column_type = attr.columns[0].type
+            if isinstance(column_type, sa.types.TypeDecorator):
+                value = column_type.process_bind_param(value, dialect)
+            state[attr.key] = value
+
+        return state
+
+    def get_etag(self):
+        """Return a strong ETag for this row without serializing it.
+
+        The version is bumped on every ORM update, the last updated date also covers
+        bulk updates which bypass the version counter.
+        """
+        timestamp = int(self.last_updated_date.timestamp() * 1_000_000)
+        return f'"{self.version}.{timestamp:x}"'
+
+    @classmethod
+    def get_resource_cache_key(cls, **identity):
+        """Return the resource cache key for a row identified by column values.
+
+        Values are coerced to the column type first, so ``"3"`` and ``3`` share a key.
+        """
+        values = []
+        for name in sorted(identity):
+            value = identity[name]
+            python_type = getattr(cls, name).type.python_type
+            if value is not None and not isinstance(value, python_type):
+                value = python_type(value)
+            values.append(f"{name}={value}")
+
+        return f"db.resource:{cls.__tablename__}:{':'.join(values)}"
+
+    def get_resource_cache_keys(self):
+        """Return the resource cache keys for this row, before and after any changes."""
+        state = sa.inspect(self)
+
+        keys = set()
+        for names in self.cache_identities:
+            current = {}
+            previous = {}
+            for name in names:
+                history = state.attrs[name].history
+                current[name] = getattr(self, name)
+                previous[name] = (
+                    history.deleted[0] if history.deleted else current[name]
+                )
+
+            keys.add(self.get_resource_cache_key(**current))
+            keys.add(self.get_resource_cache_key(**previous))
+
+        keys.add(self.get_state_cache_key(self.id))
+
+        return keys | self.get_parent_cache_keys()
+
+    def get_parent_cache_keys(self):
+        """Return the cache keys of the ``cache_parents`` of this row, before and
+        after any changes."""
+        state = sa.inspect(self)
+
+        keys = set()
+        for parent, key in self._get_parent_keys():
+            attr = state.attrs[key]
+            for value in {attr.value, *attr.history.deleted}:
+                if value is not None:
+                    keys.update(parent.get_row_cache_keys({"id": value}))
+
+        return keys
+
+    @classmethod
+    def _get_parent_keys(cls):
+        # the parent model and attribute holding its id for each of cache_parents
+        mapper = sa.inspect(cls)
+        for name in cls.cache_parents:
+            relationship = mapper.relationships[name]
+            for column in relationship.local_columns:
+                key = mapper.get_property_by_column(column).key
+                yield relationship.mapper.class_, key
+
+    @classmethod
+    def get_identity_columns(cls):
+        """Return the columns needed by :meth:`get_row_cache_keys`."""
+        names = {"id", *(name for names in cls.cache_identities for name in names)}
+        names.update(key for _, key in cls._get_parent_keys())
+        return [getattr(cls, name) for name in sorted(names)]
+
+    @classmethod
+    def get_row_cache_keys(cls, values):
+        """Return the cache keys for a row that isn't loaded, from a mapping of the
+        values of its identity columns, including those of its ``cache_parents``
+        when their ids are given."""
+        keys = {
+            cls.get_resource_cache_key(**{name: values[name] for name in names})
+            for names in cls.cache_identities
+        }
+        keys.add(cls.get_state_cache_key(values["id"]))
+
+        for parent, key in cls._get_parent_keys():
+            if values.get(key) is not None:
+                keys.update(parent.get_row_cache_keys({"id": values[key]}))
+
+        return keys
+
+    @classmethod
+    def get_state_cache_key(cls, id):
+        return f"db.state:{cls.__tablename__}:{id}"
+
+    @classmethod
+    def get_cached(cls, id):
+        """Return a row by id, from its cached column state if possible."""
+        cache_key = cls.get_state_cache_key(id)
+
+        state = near_cache.get(cache_key)
+        if state:
+            return cls.from_cached_state(state)
+
+        obj = db.session.get(cls, id)
+
+        if obj:
+            ttl = current_app.config.get("DB_STATE_CACHE_SECONDS", 300)
+            near_cache.set(cache_key, obj.get_cached_state(), ttl)
+
+        return obj
+
+
+def invalidate_resource_cache(mapper, connection, target):
+    keys = target.get_resource_cache_keys()
+    invalidate_resource_cache_keys(keys, orm.object_session(target))
+
+
+def invalidate_parent_resource_cache(mapper, connection, target):
+    keys = target.get_parent_cache_keys()
+    if keys:
+        invalidate_resource_cache_keys(keys, orm.object_session(target))
+
+
+def invalidate_resource_cache_keys(keys, session=None):
+    """Clear resource cache keys now, and again once the session commits.
+
+    Use this after statements that bypass the ORM, which don't fire mapper events.
+    """
+    near_cache.delete_many(*keys)
+
+    # readers may refill the cache before the transaction commits, so clear it again
+    if session is not None:
+        session.info.setdefault("invalidated_resource_cache_keys", set()).update(keys)
+
+
+def invalidate_resource_cache_rows(model, rows, session=None):
+    """Clear the cache keys of rows changed by a statement that bypasses the ORM.
+
+    Rows need the model's :meth:`~BaseModel.get_identity_columns`, e.g. from
+    ``RETURNING`` or selected before the statement.
+    """
+    keys = set()
+    for row in rows:
+        keys.update(model.get_row_cache_keys(row._mapping))
+
+    invalidate_resource_cache_keys(keys, session)
+
+
+def invalidate_resource_cache_where(model, *criteria, session=None):
+    """Clear the cache keys of the rows matching criteria.
+
+    Call this for bulk updates and deletes, like ``Query.update`` or a Core
+    ``UPDATE``, which don't fire mapper events. Before a delete, or an update that
+    changes identity columns, the rows are still found with their old values.
+    """
+    if session is None:
+        session = db.session()
+
+    statement = sa.select(*model.get_identity_columns()).where(*criteria)
+    invalidate_resource_cache_rows(model, session.execute(statement), session)
+
+
+def invalidate_resource_cache_after_commit(session):
+    keys = session.info.pop("invalidated_resource_cache_keys", None)
+    if keys:
+        near_cache.delete_many(*keys)
+
+
+event.listen(BaseModel, "after_delete", invalidate_resource_cache, propagate=True)
+event.listen(
+    BaseModel, "after_insert", invalidate_parent_resource_cache, propagate=True
+)
+event.listen(BaseModel, "after_update", invalidate_resource_cache, propagate=True)
+event.listen(db.session, "after_commit", invalidate_resource_cache_after_commit)
+
 
 Coordinates = sqlalchemy_utils.CompositeType(
     "coordinates",
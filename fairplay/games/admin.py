@@ -23,18 +23,18 @@ def init_app(app):
     admin.register_blueprint(games)
 
 
-def get_game(id):
+def get_game(id, profile="admin-detail"):
     try:
         id = uuid.UUID(id)
     except ValueError:
         abort(404)
 
-    games = get_games()
+    games = get_games(profile=profile)
     return db.one_or_404(games.filter(Game.id == id))
 
 
-def get_games():
-    return Game.query.filter_by_current_user()
+def get_games(profile="admin-table"):
+    return Game.query.filter_by_current_user().with_profile(profile)
 
 
 def iter_courses():
@@ -3,7 +3,15 @@ from marshmallow import ValidationError, fields, validate
 from marshmallow_sqlalchemy import SQLAlchemySchema
 
 from ..api.v1 import v1
-from ..api.utils.pagination import apply_paged_pagination
+from ..api.utils.batch import (
+    bulk_create,
+    bulk_delete,
+    bulk_update,
+    get_batch_data,
+    validate_unique,
+)
+from ..api.utils.pagination import apply_pagination
+from ..api.utils.serialization import dump_rows, with_schema_columns
 from ..courses.api import validate_course
 from ..courses.models import current_course
 from ..db import db
@@ -29,8 +37,8 @@ class GameSchema(SQLAlchemySchema):
     course_id = fields.UUID(required=True)
 
 
-def get_games():
-    return Game.query
+def get_games(profile="api-detail"):
+    return Game.query.with_profile(profile)
 
 
 def get_game(id):
@@ -81,12 +89,14 @@ def delete(id):
 
 @games.route("", methods=["GET"])
 def list():
-    games = get_games()
-
-    games = apply_paged_pagination(games)
+    games = get_games(profile="api-list")
 
     schema = GameSchema()
-    return schema.dump(games, many=True)
+
+    games = with_schema_columns(games, schema, Game.created_date)
+    games = apply_pagination(games, Game.created_date, Game.id)
+
+    return dump_rows(schema, games)
 
 
 @games.route("/<id>", methods=["GET"])
@@ -129,8 +139,8 @@ class GameHoleSchema(SQLAlchemySchema):
     game_id = fields.UUID(required=True)
 
 
-def get_game_holes(game_id=None):
-    holes = GameHole.query
+def get_game_holes(game_id=None, profile="api-detail"):
+    holes = GameHole.query.with_profile(profile)
 
     if game_id:
         holes = holes.filter(GameHole.game_id == game_id)
@@ -150,12 +160,76 @@ def get_game_hole(game_id=None, id=None, number=None):
 @holes.route("/holes", endpoint="list", methods=["POST"])
 @holes.route("/<game_id>/holes", endpoint="list", methods=["POST"])
 def list_holes(game_id=None):
-    holes = get_game_holes(game_id=game_id)
-
-    holes = apply_paged_pagination(holes)
+    holes = get_game_holes(game_id=game_id, profile="api-list")
 
     schema = GameHoleSchema()
-    return schema.dump(holes, many=True)
+
+    holes = with_schema_columns(holes, schema, GameHole.created_date)
+    holes = apply_pagination(holes, GameHole.created_date, GameHole.id)
+
+    return dump_rows(schema, holes)
+
+
+@holes.route("/<game_id>/holes/batch", endpoint="create_batch", methods=["POST"])
+def create_holes(game_id):
+    game = get_game(game_id)
+
+    schema = GameHoleSchema(many=True, load_instance=False, exclude=("game_id",))
+    data = schema.load(get_batch_data())
+
+    validate_unique(data, "number")
+
+    for hole in data:
+        hole["game_id"] = game.id
+
+    holes = bulk_create(GameHole, data)
+
+    Game.update_hole_aggregates(game.id)
+
+    db.session.commit()
+
+    schema = GameHoleSchema(many=True)
+    return schema.dump(holes), 201
+
+
+@holes.route("/<game_id>/holes/batch", endpoint="delete_batch", methods=["DELETE"])
+def delete_holes(game_id):
+    game = get_game(game_id)
+
+    numbers = fields.List(fields.Integer(), required=True)
+    numbers = numbers.deserialize(get_batch_data())
+
+    bulk_delete(GameHole, GameHole.game_id == game.id, GameHole.number.in_(numbers))
+
+    Game.update_hole_aggregates(game.id)
+
+    db.session.commit()
+
+    return "", 204
+
+
+@holes.route("/<game_id>/holes/batch", endpoint="update_batch", methods=["PATCH"])
+def update_holes(game_id):
+    game = get_game(game_id)
+
+    schema = GameHoleSchema(
+        many=True, load_instance=False, exclude=("game_id",), partial=True
+    )
+    data = schema.load(get_batch_data())
+
+    validate_unique(data, "number")
+
+    ids = bulk_update(GameHole, data, GameHole.game_id == game.id, key="number")
+
+    Game.update_hole_aggregates(game.id)
+
+    db.session.commit()
+
+    holes = get_game_holes(game_id=game.id).filter(GameHole.id.in_(ids))
+    holes = holes.order_by(GameHole.number)
+
+    schema = GameHoleSchema(many=True)
+    return schema.dump(holes)
 
 
 @holes.route("/holes/<id>", endpoint="read", methods=["GET"])
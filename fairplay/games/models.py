@@ -6,7 +6,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
 from ..courses.models import current_course
-from ..db import BaseModel, BaseQuery, db
+from ..db import BaseModel, BaseQuery, db, invalidate_resource_cache_rows
 
 
 class GameQuery(BaseQuery):
@@ -31,7 +31,7 @@ class Game(BaseModel):
         nullable=False,
     )
 
-    course = orm.relationship("Course", lazy="joined")
+    course = orm.relationship("Course")
     holes = orm.relationship(
         "GameHole",
         collection_class=attribute_mapped_collection("number"),
@@ -85,6 +85,34 @@ class Game(BaseModel):
         ),
     )
 
+    @classmethod
+    def update_hole_aggregates(cls, *ids):
+        """Recompute the aggregated hole columns, e.g. after bulk changes to holes."""
+        table = cls.__table__
+        holes = GameHole.__table__
+
+        def aggregate(expression):
+            statement = sa.select(expression).where(holes.c.game_id == table.c.id)
+            return statement.scalar_subquery()
+
+        all_finished = sa.func.count(holes.c.date_finished) == sa.func.count(holes.c.id)
+
+        statement = (
+            sa.update(table)
+            .where(table.c.id.in_(ids))
+            .values(
+                date_started=aggregate(sa.func.min(holes.c.date_started)),
+                date_finished=aggregate(
+                    sa.case((all_finished, sa.func.max(holes.c.date_finished)))
+                ),
+                hole_count=aggregate(sa.func.count(holes.c.number)),
+            )
+        )
+
+        # the cached game and its ETag are stale once the aggregates change
+        rows = db.session.execute(statement.returning(*cls.get_identity_columns()))
+        invalidate_resource_cache_rows(cls, rows, db.session())
+
 
 class GameHole(BaseModel):
     __tablename__ = "game_hole"
@@ -107,8 +135,10 @@ class GameHole(BaseModel):
         sa.ForeignKey("course_hole.id", ondelete="set null"),
     )
 
-    game = orm.relationship("Game", lazy="joined", back_populates="holes")
-    hole = orm.relationship("CourseHole", lazy="joined")
+    game = orm.relationship("Game", back_populates="holes")
+    hole = orm.relationship("CourseHole")
+
+    cache_parents = ("game",)
 
     @hybrid_property
     def duration(self):
@@ -142,8 +172,10 @@ class GamePlayer(BaseModel):
         nullable=False,
     )
 
-    game = orm.relationship("Game", lazy="joined", back_populates="players")
-    player = orm.relationship("Player", lazy="joined")
+    game = orm.relationship("Game", back_populates="players")
+    player = orm.relationship("Player")
+
+    cache_parents = ("game",)
 
     __table_args__ = (
         sa.CheckConstraint(
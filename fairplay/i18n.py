@@ -1,10 +1,15 @@
+import bisect
 import datetime as dt
+import importlib
+import threading
 
 import flag
 import pytz
 
-from faker import Faker
-from flask import request, session
+from faker import Factory
+from faker.config import PROVIDERS
+from faker.generator import Generator
+from flask import current_app, g, request, session
 from flask_babel import (
     Babel,
     force_locale,
@@ -48,6 +53,12 @@ __all__ = [
 
 babel = Babel()
 
+_fakers = {}
+_fakers_lock = threading.Lock()
+_faker_providers = None
+
+_timezones = (dt.datetime.min, ())
+
 
 def init_i18n(app):
     babel.init_app(
@@ -57,6 +68,9 @@ def init_i18n(app):
         timezone_selector=timezone_selector,
     )
 
+    app.extensions["locale_choices"] = {}
+    app.extensions["translations"] = None
+
     app.add_template_global(get_locale)
     app.add_template_global(get_timezone)
     app.add_template_global(iter_locales)
@@ -66,12 +80,19 @@ def init_i18n(app):
     app.add_template_filter(flag.flagize, "flagize")
 
 
-def iter_locales(current_locale=None, flagize=False):
-    if not current_locale:
-        current_locale = get_locale()
+def _get_next_transition(tz, now):
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not transitions:
+        return
 
+    i = bisect.bisect_right(transitions, now)
+    if i < len(transitions):
+        return transitions[i]
+
+
+def _iter_locales(current_locale, flagize):
     for locale in sorted(
-        babel.list_translations(),
+        list_translations(),
         key=lambda l: l.get_language_name(str(current_locale)),
     ):
         value = str(locale)
@@ -97,9 +118,7 @@ def iter_locales(current_locale=None, flagize=False):
         yield (value, label)
 
 
-def iter_timezones():
-    now = dt.datetime.now()
-
+def _iter_timezones(now):
     yield ("UTC", "UTC")
 
     for tzname in sorted(pytz.common_timezones):
@@ -109,19 +128,64 @@ def iter_timezones():
         tz = pytz.timezone(tzname)
         label = tz.zone.replace("_", " ")
 
-        offset = tz.utcoffset(now)
+        offset = pytz.utc.localize(now).astimezone(tz).utcoffset()
 
-        offset_hours = offset.total_seconds() / 3600
-        offset_mins = offset.total_seconds() / 60 % 60
+        offset_mins = int(offset.total_seconds() // 60)
+        offset_hours, offset_mins = divmod(abs(offset_mins), 60)
+        sign = offset < dt.timedelta() and "-" or "+"
 
         if offset_hours or offset_mins:
-            label = f"{label} ({offset_hours:+0{2}.{0}f}:{offset_mins:0{2}.{0}f})"
+            label = f"{label} ({sign}{offset_hours}:{offset_mins:02})"
         elif tzname not in ("GMT", "UTC"):
             label = f"{label} (UTC)"
 
         yield (tzname, label)
 
 
+def iter_locales(current_locale=None, flagize=False):
+    """Return the locale choices labelled in the current locale.
+
+    The choices are only worked out once per locale and cached as a tuple.
+    """
+    if not current_locale:
+        current_locale = get_locale()
+
+    locale_choices = current_app.extensions["locale_choices"]
+    key = str(current_locale), flagize
+
+    choices = locale_choices.get(key)
+    if choices is None:
+        choices = locale_choices[key] = tuple(_iter_locales(current_locale, flagize))
+
+    return choices
+
+
+def iter_timezones():
+    """Return the timezone choices labelled with their current offset from UTC.
+
+    The choices are cached as a tuple until the next daylight saving time change in
+    any of the timezones.
+    """
+    global _timezones
+
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+    expires, choices = _timezones
+    if now < expires:
+        return choices
+
+    choices = tuple(_iter_timezones(now))
+
+    transitions = (
+        _get_next_transition(pytz.timezone(tzname), now) for tzname, _ in choices
+    )
+    expires = min(filter(None, transitions), default=dt.datetime.max)
+
+    _timezones = expires, choices
+
+    return choices
+
+
 def locale_to_flag(locale):
     """Convert a locale to a approximate representative country flag."""
     s = str(locale)
@@ -139,10 +203,27 @@ def locale_to_flag(locale):
     return flag.flag(s)
 
 
+def list_translations():
+    """Return the locales there are translations for.
+
+    The translation directories are only scanned once per process.
+    """
+    translations = current_app.extensions["translations"]
+    if translations is None:
+        translations = tuple(babel.list_translations())
+        current_app.extensions["translations"] = translations
+
+    return translations
+
+
 def locale_selector():
     if not request:
         return
 
+    # babel can ask more than once per request, e.g. after a refresh
+    if "selected_locale" in g:
+        return g.selected_locale
+
     # try get locale from current session
     locale = session.get("locale")
 
@@ -152,9 +233,11 @@ def locale_selector():
 
     # lastly, try get the locale from the browser
     if not locale:
-        locales = [str(locale) for locale in babel.list_translations()]
+        locales = [str(locale) for locale in list_translations()]
         locale = request.accept_languages.best_match(locales)
 
+    g.selected_locale = locale
+
     return locale
 
 
@@ -162,6 +245,9 @@ def timezone_selector():
     if not request:
         return
 
+    if "selected_timezone" in g:
+        return g.selected_timezone
+
     # try get timezone from current session
     tz = session.get("timezone")
 
@@ -169,6 +255,8 @@ def timezone_selector():
     if not tz and current_user.is_authenticated:
         tz = current_user.tz
 
+    g.selected_timezone = tz
+
     return tz
 
 
@@ -178,6 +266,8 @@ def set_locale(locale):
     if current_user.is_authenticated:
         current_user.locale = locale
 
+    g.pop("selected_locale", None)
+
 
 def set_timezone(tz):
     session["timezone"] = tz
@@ -185,20 +275,110 @@ def set_timezone(tz):
     if current_user.is_authenticated:
         current_user.tz = tz
 
+    g.pop("selected_timezone", None)
+
 
 _ = gettext
 
 
-def get_faker():
-    return Faker(str(get_locale()))
+def _get_faker_providers():
+    """Return the provider module offering each formatter, e.g. ``"city"``."""
+    global _faker_providers
+
+    if _faker_providers is None:
+        providers = {}
+        for path in PROVIDERS:
+            for name in dir(importlib.import_module(path).Provider):
+                if not name.startswith("_"):
+                    providers.setdefault(name, path)
+        _faker_providers = providers
+
+    return _faker_providers
+
+
+class LazyFaker(Generator):
+    """A Faker generator that only loads a provider, for its locale, the first
+    time one of its formatters is used, instead of loading all of them up front.
+    """
+
+    def __init__(self, locale):
+        super().__init__(locale=locale, use_weighting=True)
+        self._locale = locale
+        self._loaded = set()
+        self._load_lock = threading.RLock()
+        # checks the locale, without loading any providers
+        Factory.create(locale, providers=["faker.providers"], generator=self)
+
+    def __getattr__(self, name):
+        # only called for names that aren't set, i.e. formatters not loaded yet
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        path = _get_faker_providers().get(name)
+        with self._load_lock:
+            if name not in self.__dict__:
+                if path and path not in self._loaded:
+                    self._load([path])
+                else:
+                    # a formatter only some locales have, e.g. ``kana_name``
+                    self._load([p for p in PROVIDERS if p not in self._loaded])
+
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def _load(self, paths):
+        if paths:
+            Factory.create(self._locale, providers=paths, generator=self)
+            self._loaded.update(paths)
+
+
+def create_faker(locale=None):
+    """Return a new Faker for a locale, the current locale by default, e.g. to
+    seed without changing the random state of the one :func:`get_faker` shares.
+    """
+    return LazyFaker(locale or str(get_locale() or "en_US"))
+
+
+def get_faker(locale=None):
+    """Return the process's Faker for a locale, the current locale by default.
+
+    Each one is only created the first time its locale is used and then reused.
+    """
+    if not locale:
+        locale = str(get_locale() or "en_US")
+
+    faker = _fakers.get(locale)
+    if faker:
+        return faker
+
+    with _fakers_lock:
+        faker = _fakers.get(locale)
+        if not faker:
+            faker = _fakers[locale] = create_faker(locale)
+
+    return faker
 
 
 faker = LocalProxy(get_faker)
 
 
 class Fake:
+    def __init__(self, faker=None):
+        self._faker = faker
+
     def __getattr__(self, name):
-        return LazyString(lambda: getattr(faker, name)())
+        return LazyString(lambda: getattr(self._faker or faker, name)())
+
+    def batch(self, name, n, *args, locale=None, **kwargs):
+        """Return a list of ``n`` values from a provider, e.g. ``batch("name", 100)``.
+
+        The provider is looked up once, so this is much quicker than evaluating
+        ``n`` lazy strings when seeding a database.
+        """
+        provider = getattr(self._faker or get_faker(locale), name)
+        return [provider(*args, **kwargs) for _ in range(n)]
 
 
 fake = Fake()
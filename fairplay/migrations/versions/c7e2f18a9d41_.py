@@ -0,0 +1,43 @@
+"""add version columns
+
+Revision ID: c7e2f18a9d41
+Revises: 9429ea250104
+Create Date: 2026-10-18 10:12:44.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c7e2f18a9d41"
+down_revision = "9429ea250104"
+branch_labels = None
+depends_on = None
+
+
+TABLES = [
+    "audit",
+    "course",
+    "course_feature",
+    "course_hole",
+    "game",
+    "game_hole",
+    "game_player",
+    "player",
+    "users",
+]
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column("version", sa.Integer(), server_default="1", nullable=False)
+            )
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column("version")
@@ -24,18 +24,18 @@ def init_app(app):
     admin.register_blueprint(players)
 
 
-def get_player(id):
+def get_player(id, profile="admin-detail"):
     try:
         id = uuid.UUID(id)
     except ValueError:
         abort(404)
 
-    players = get_players()
+    players = get_players(profile=profile)
     return db.one_or_404(players.filter(Player.id == id))
 
 
-def get_players():
-    return Player.query
+def get_players(profile="admin-table"):
+    return Player.query.with_profile(profile)
 
 
 class PlayerForm(FlaskForm):
@@ -4,7 +4,8 @@ from marshmallow import fields, validate
 from marshmallow_sqlalchemy import SQLAlchemySchema
 
 from ..api.v1 import v1
-from ..api.utils.pagination import apply_paged_pagination
+from ..api.utils.pagination import apply_pagination
+from ..api.utils.serialization import dump_rows, with_schema_columns
 from ..courses.api import validate_course
 from ..courses.models import current_course
 from ..db import db
@@ -30,8 +31,8 @@ class PlayerSchema(SQLAlchemySchema):
     course_id = fields.UUID(required=True, validate=(validate_course,))
 
 
-def get_players():
-    return Player.query.filter_by_current_course()
+def get_players(profile="api-detail"):
+    return Player.query.filter_by_current_course().with_profile(profile)
 
 
 def get_player(id):
@@ -69,12 +70,14 @@ def delete(id):
 
 @players.route("", methods=["GET"])
 def list():
-    players = get_players()
-
-    players = apply_paged_pagination(players)
+    players = get_players(profile="api-list")
 
     schema = PlayerSchema()
-    return schema.dump(players, many=True)
+
+    players = with_schema_columns(players, schema, Player.created_date)
+    players = apply_pagination(players, Player.created_date, Player.id)
+
+    return dump_rows(schema, players)
 
 
 @players.route("/<id>", methods=["GET"])
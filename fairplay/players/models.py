@@ -35,11 +35,11 @@ class Player(BaseModel):
         sa.ForeignKey("player.id", ondelete="set null"),
     )
 
-    course = orm.relationship("Course", lazy="joined", back_populates="players")
+    course = orm.relationship("Course", back_populates="players")
     games = orm.relationship(
         "Game", secondary="game_player", lazy="dynamic", viewonly=True
     )
-    player = orm.relationship("Player", lazy="joined")
+    player = orm.relationship("Player")
 
     query_class = PlayerQuery
 
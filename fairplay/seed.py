@@ -0,0 +1,236 @@
+"""Generate large volumes of synthetic data, e.g. to profile the API."""
+import datetime as dt
+import random
+import time
+import uuid
+
+import click
+import sqlalchemy as sa
+
+from flask.cli import with_appcontext
+
+from .courses.models import Course, CourseFeature, CourseHole
+from .db import db
+from .games.models import Game, GameHole, GamePlayer
+from .i18n import Fake, create_faker
+from .players.models import Player
+
+
+# parents come before their children, so rows are inserted in this order
+SEED_MODELS = (Course, CourseHole, CourseFeature, Player, Game, GameHole, GamePlayer)
+
+HOLES_PER_COURSE = 18
+
+
+class SeedWriter:
+    """Buffer rows per table and write them with multi-row inserts in chunks."""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.counts = dict.fromkeys(SEED_MODELS, 0)
+
+        self._buffers = {model: [] for model in SEED_MODELS}
+        self._size = 0
+
+    def add(self, model, rows):
+        self._buffers[model].extend(rows)
+        self._size += len(rows)
+
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for model, rows in self._buffers.items():
+            if rows:
+                db.session.execute(sa.insert(model.__table__), rows)
+                self.counts[model] += len(rows)
+                rows.clear()
+
+        db.session.commit()
+        self._size = 0
+
+
+def _point(lon, lat):
+    return f"SRID=4326;POINT({lon:.6f} {lat:.6f})"
+
+
+def _square(lon, lat, size):
+    corners = [
+        (lon - size, lat - size),
+        (lon + size, lat - size),
+        (lon + size, lat + size),
+        (lon - size, lat + size),
+        (lon - size, lat - size),
+    ]
+    ring = ", ".join(f"{x:.6f} {y:.6f}" for x, y in corners)
+    return f"SRID=4326;POLYGON(({ring}))"
+
+
+def _generate_course(writer, rng, fake, now, players, games, game_players, features):
+    course_id = uuid.uuid1()
+    lon, lat = rng.uniform(-180, 180), rng.uniform(-60, 70)
+
+    (name,) = fake.batch("city", 1)
+    (description,) = fake.batch("sentence", 1)
+
+    writer.add(
+        Course,
+        [
+            {
+                "id": course_id,
+                "name": f"{name} Golf Club",
+                "description": description,
+                "pos": _point(lon, lat),
+                "hole_count": HOLES_PER_COURSE,
+            }
+        ],
+    )
+
+    holes = []
+    hole_features = []
+    for number in range(1, HOLES_PER_COURSE + 1):
+        hole_lon = lon + rng.uniform(-0.01, 0.01)
+        hole_lat = lat + rng.uniform(-0.01, 0.01)
+
+        hole = {
+            "id": uuid.uuid1(),
+            "course_id": course_id,
+            "number": number,
+            "index": number,
+            "par": rng.choice((3, 4, 4, 4, 5)),
+            "pos": _point(hole_lon, hole_lat),
+        }
+        holes.append(hole)
+
+        for feature_type, _ in rng.sample(CourseFeature.FEATURE_TYPE_CHOICES, features):
+            hole_features.append(
+                {
+                    "id": uuid.uuid1(),
+                    "hole_id": hole["id"],
+                    "type": feature_type,
+                    "pos": _square(
+                        hole_lon + rng.uniform(-0.001, 0.001),
+                        hole_lat + rng.uniform(-0.001, 0.001),
+                        rng.uniform(0.00005, 0.0002),
+                    ),
+                }
+            )
+
+    writer.add(CourseHole, holes)
+    writer.add(CourseFeature, hole_features)
+
+    course_players = [
+        {
+            "id": uuid.uuid1(),
+            "course_id": course_id,
+            "name": name,
+            "handicap": rng.randint(1, 36),
+        }
+        for name in fake.batch("name", players)
+    ]
+    writer.add(Player, course_players)
+
+    for name in fake.batch("catch_phrase", games):
+        game_id = uuid.uuid1()
+        date_started = now - dt.timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+
+        game_holes = []
+        date_finished = date_started
+        for hole in holes:
+            hole_started = date_finished
+            date_finished = hole_started + dt.timedelta(minutes=rng.randint(5, 20))
+
+            game_holes.append(
+                {
+                    "id": uuid.uuid1(),
+                    "game_id": game_id,
+                    "hole_id": hole["id"],
+                    "number": hole["number"],
+                    "index": hole["index"],
+                    "par": hole["par"],
+                    "date_started": hole_started,
+                    "date_finished": date_finished,
+                }
+            )
+
+        players_in_game = rng.sample(course_players, min(game_players, players))
+
+        writer.add(
+            Game,
+            [
+                {
+                    "id": game_id,
+                    "course_id": course_id,
+                    "name": name,
+                    "date_started": date_started,
+                    "date_finished": date_finished,
+                    "hole_count": len(game_holes),
+                    "player_count": len(players_in_game),
+                }
+            ],
+        )
+        writer.add(GameHole, game_holes)
+        writer.add(
+            GamePlayer,
+            [
+                {
+                    "id": uuid.uuid1(),
+                    "game_id": game_id,
+                    "player_id": player["id"],
+                    "name": player["name"],
+                    "handicap": player["handicap"],
+                }
+                for player in players_in_game
+            ],
+        )
+
+
+@click.command("seed")
+@click.option("--courses", default=10, help="Number of courses to create.")
+@click.option("--players", default=50, help="Number of players per course.")
+@click.option("--games", default=100, help="Number of games per course.")
+@click.option("--game-players", default=4, help="Number of players per game.")
+@click.option("--features", default=3, help="Number of features per hole.")
+@click.option("--chunk-size", default=5000, help="Number of rows per insert.")
+@click.option("--locale", help="Locale to generate names in.")
+@click.option("--seed", type=int, help="Seed for repeatable data.")
+@with_appcontext
+def seed_command(
+    courses, players, games, game_players, features, chunk_size, locale, seed
+):
+    """Fill the database with synthetic courses, players and games.
+
+    Each course has 18 holes, and every game is played over all of them. Rows are
+    written with multi-row inserts, skipping the ORM, so aggregates are set here.
+    """
+    if features > len(CourseFeature.FEATURE_TYPE_CHOICES):
+        raise click.BadParameter(
+            f"at most {len(CourseFeature.FEATURE_TYPE_CHOICES)}",
+            param_hint="--features",
+        )
+
+    rng = random.Random(seed)
+    # its own Faker, so seeding it leaves the process's shared ones alone
+    faker = create_faker(locale)
+    if seed is not None:
+        faker.seed_instance(seed)
+    fake = Fake(faker)
+
+    writer = SeedWriter(chunk_size)
+    now = dt.datetime.now(dt.timezone.utc)
+    start = time.perf_counter()
+
+    with click.progressbar(range(courses), label="Seeding courses") as bar:
+        for _ in bar:
+            _generate_course(
+                writer, rng, fake, now, players, games, game_players, features
+            )
+
+    writer.flush()
+
+    elapsed = time.perf_counter() - start
+    total = sum(writer.counts.values())
+
+    for model, count in writer.counts.items():
+        click.echo(f"{model.__tablename__:<16} {count:>12,}")
+    click.echo(f"{'total':<16} {total:>12,} in {elapsed:.1f}s")
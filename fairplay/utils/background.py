@@ -0,0 +1,66 @@
+import concurrent.futures
+import logging
+import os
+import threading
+
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+
+class PerProcess:
+    """Create a value the first time it's used in each process.
+
+    Threads don't survive a fork, so anything that starts them, like a pool or a
+    background thread, is created again by each worker rather than at import time.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+
+    @property
+    def created(self):
+        """Whether the value has been created in this process."""
+        return self._pid == os.getpid()
+
+    def get(self, *args, **kwargs):
+        """Return the value, calling ``factory`` with the arguments to create it."""
+        if not self.created:
+            with self._lock:
+                if not self.created:
+                    self._value = self.factory(*args, **kwargs)
+                    self._pid = os.getpid()
+
+        return self._value
+
+
+def _create_executor():
+    return concurrent.futures.ThreadPoolExecutor(
+        current_app.config.get("BACKGROUND_WORKERS", 2), "fairplay-background"
+    )
+
+
+_executor = PerProcess(_create_executor)
+
+
+def _run(app, f, args, kwargs):
+    with app.app_context():
+        try:
+            return f(*args, **kwargs)
+        except Exception:
+            logger.exception("Error running %s in the background", f.__qualname__)
+
+
+def run_in_background(f, *args, **kwargs):
+    """Run a function in an app context on a background thread of this worker.
+
+    This is meant for small follow-up work that doesn't need to hold up the
+    response, errors are logged rather than raised.
+    """
+    app = current_app._get_current_object()
+    return _executor.get().submit(_run, app, f, args, kwargs)
@@ -1,68 +1,291 @@
+import collections
+import concurrent.futures
+import ipaddress
 import logging
 import os
+import threading
+import time
 
 import geoip2.database
 import geoip2.webservice
+import maxminddb
+import requests
 
 from flask import Flask, current_app, request
 from geoip2.errors import AddressNotFoundError, GeoIP2Error
 
-from ..cache import shared_cache, worker_cache
+from ..cache import shared_cache
 from ..i18n import _, get_locale
+from .background import PerProcess
 
 UNKNOWN_LOCATION = _("Unknown")
 
+DATABASE_MODES = {
+    "auto": maxminddb.MODE_AUTO,
+    "file": maxminddb.MODE_FILE,
+    "memory": maxminddb.MODE_MEMORY,
+    "mmap": maxminddb.MODE_MMAP,
+    "mmap_ext": maxminddb.MODE_MMAP_EXT,
+}
+
 logger = logging.getLogger(__name__)
 
+_missing = object()
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+_webservice_clients = {}
+_webservice_lock = threading.Lock()
+_webservice_lookups = {}
+
+
+class ResultCache:
+    """A size-bounded LRU cache of GeoIP results with per-entry expiry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+
+        self.evictions = self.hits = self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = time.monotonic() + ttl, value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
 
 def init_geoip(app: Flask):
     app.config.setdefault("GEOIP_DATABASE", "/usr/share/GeoIP/GeoLite2-City.mmdb")
+    app.config.setdefault("GEOIP_DATABASE_MODE", "auto")
+
+    if app.config["GEOIP_DATABASE_MODE"] not in DATABASE_MODES:
+        raise RuntimeError(
+            f"Invalid GEOIP_DATABASE_MODE: {app.config['GEOIP_DATABASE_MODE']}"
+        )
+
+    app.extensions["geoip_cache"] = ResultCache(
+        app.config.get("GEOIP_CACHE_SIZE", 10000)
+    )
 
     app.add_template_global(get_country_code)
 
 
-def _get_result_database(ip_address, database):
-    with geoip2.database.Reader(database) as reader:
+def _get_reader(database):
+    """Return the process's reader for database, reopening it if the file changed.
+
+    Readers are thread-safe and kept open, so lookups don't reopen and parse the
+    database. With a memory-mapped mode the pages are shared between workers.
+    """
+    mtime = os.stat(database).st_mtime_ns
+
+    reader, reader_mtime = _readers.get(database, (None, None))
+    if reader and reader_mtime == mtime:
+        return reader
+
+    with _readers_lock:
+        reader, reader_mtime = _readers.get(database, (None, None))
+        if reader and reader_mtime == mtime:
+            return reader
+
+        mode = DATABASE_MODES[current_app.config.get("GEOIP_DATABASE_MODE", "auto")]
+
+        # the old reader is left to be closed when it's no longer in use
+        reader = geoip2.database.Reader(database, mode=mode)
+        _readers[database] = reader, mtime
+
+    return reader
+
+
+def _get_result_database(ip_address, reader):
+    try:
+        result = reader.city(ip_address)
+    except AddressNotFoundError:
+        return
+    except TypeError:
         try:
-            result = reader.city(ip_address)
+            result = reader.country(ip_address)
         except AddressNotFoundError:
             return
-        except TypeError:
-            try:
-                result = reader.country(ip_address)
-            except AddressNotFoundError:
-                return
 
     return _parse_geoip2_result(result)
 
 
-def _get_result_webservice(ip_address, options):
+class WebServiceClient(geoip2.webservice.Client):
+    """A webservice client that can also be pointed at a base URI, e.g. a local
+    stub served over plain HTTP, with ``GEOIP_WEBSERVICE_BASE_URI``."""
+
+    def __init__(self, *args, base_uri=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # the client only builds https URIs from a host
+        if base_uri:
+            self._base_uri = base_uri.rstrip("/")
+
+
+def _get_webservice_client(options):
+    """Return the process's webservice client, which keeps connections alive."""
     account_id = options.get("account_id")
     license_key = options.get("license_key")
     host = options.get("host")
     use_geolite = options.get("use_geolite")
 
-    kw = {}
+    kw = {"timeout": options.get("timeout", 1.0)}
     if host:
         kw["host"] = host
     elif use_geolite:
         kw["host"] = "geolite.info"
 
-    with geoip2.webservice.Client(account_id, license_key, **kw) as client:
-        try:
-            result = client.city(ip_address)
-        except AddressNotFoundError:
-            return
-        except GeoIP2Error as e:
-            logger.exception("Error getting GeoIP for %s: %s", ip_address, e)
-            return
+    client_key = (
+        account_id,
+        license_key,
+        options.get("base_uri"),
+        tuple(sorted(kw.items())),
+    )
+
+    client = _webservice_clients.get(client_key)
+    if client:
+        return client
+
+    with _webservice_lock:
+        client = _webservice_clients.get(client_key)
+        if client:
+            return client
+
+        client = WebServiceClient(
+            account_id, license_key, base_uri=options.get("base_uri"), **kw
+        )
+        _webservice_clients[client_key] = client
+
+    return client
+
+
+def _create_webservice_executor(options):
+    # lookups in flight were started by the parent's threads, which didn't fork
+    _webservice_lookups.clear()
+
+    return concurrent.futures.ThreadPoolExecutor(
+        options.get("max_workers", 4), "fairplay-geoip"
+    )
+
+
+_webservice_executor = PerProcess(_create_webservice_executor)
+
+
+def _lookup_webservice(client, ip_address):
+    try:
+        result = client.city(ip_address)
+    except AddressNotFoundError:
+        return
+    except (GeoIP2Error, requests.RequestException) as e:
+        logger.exception("Error getting GeoIP for %s: %s", ip_address, e)
+        return
 
     return _parse_geoip2_result(result)
 
 
-def _parse_geoip2_result(result):
+def _forget_webservice_lookup(ip_address):
+    # this can run straight away while the lock is held, so it doesn't take it, but
+    # the entry is only replaced once it's gone, so it can't remove a newer lookup
+    def forget(future):
+        if _webservice_lookups.get(ip_address) is future:
+            _webservice_lookups.pop(ip_address, None)
+
+    return forget
+
+
+def _get_results_webservice(ip_addresses, options):
+    """Look up addresses with the webservice, giving up after a timeout.
+
+    All the lookups are made at once and share one deadline. Concurrent lookups of
+    the same address share one request. On a timeout the lookup carries on in the
+    background, but the address is left out so the caller can fall back to the
+    database.
+    """
+    client = _get_webservice_client(options)
+    executor = _webservice_executor.get(options)
+
+    futures = {}
+    with _webservice_lock:
+        for ip_address in ip_addresses:
+            future = _webservice_lookups.get(ip_address)
+            if not future:
+                future = executor.submit(_lookup_webservice, client, ip_address)
+                _webservice_lookups[ip_address] = future
+                future.add_done_callback(_forget_webservice_lookup(ip_address))
+            futures[ip_address] = future
+
+    deadline = time.monotonic() + options.get("timeout", 1.0)
+
+    results = {}
+    for ip_address, future in futures.items():
+        try:
+            results[ip_address] = future.result(max(0, deadline - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            logger.warning("Timed out getting GeoIP for %s", ip_address)
+
+    return results
+
+
+def _get_name(names, locale):
+    for key in (locale, locale.split("_")[0], "en"):
+        if key in names:
+            return names[key]
+
+
+def _localize_result(result):
     locale = str(get_locale()) or "en"
 
+    city = result["city"]
+    country = result["country"]
+    state = result["state"]
+
+    return {
+        "city": city and _get_name(city, locale),
+        "country": country and (country[0], _get_name(country[1], locale)),
+        "state": state and (state[0], _get_name(state[1], locale)),
+        "tz": result["tz"],
+    }
+
+
+def _parse_geoip2_result(result):
     try:
         location = result.location
     except AttributeError:
@@ -71,65 +294,61 @@ def _parse_geoip2_result(result):
         tz = location.time_zone
 
     try:
-        city = result.city
+        city = result.city.names
     except AttributeError:
         city = None
-    if city:
-        try:
-            try:
-                city_name = city.names[locale]
-            except KeyError:
-                city_name = city.names[locale.split("_")[0]]
-        except KeyError:
-            city_name = city.names["en"]
 
     try:
         state = result.subdivisions.most_specific
     except AttributeError:
         state = None
-    if state:
-        try:
-            try:
-                state_name = state.names[locale]
-            except KeyError:
-                state_name = state.names[locale.split("_")[0]]
-        except KeyError:
-            state_name = state.names["en"]
 
     try:
         country = result.country
     except AttributeError:
         country = None
-    if country:
-        try:
-            try:
-                country_name = country.names[locale]
-            except KeyError:
-                country_name = country.names[locale.split("_")[0]]
-        except KeyError:
-            country_name = country.names["en"]
 
+    # names are kept for every locale and only picked when the result is read
     return {
-        "city": city and city_name,
-        "country": country and (country.iso_code, country_name),
-        "state": state and (state.iso_code, state_name),
+        "city": city or None,
+        "country": country and country.names and (country.iso_code, country.names),
+        "state": state and state.names and (state.iso_code, state.names),
         "tz": tz,
     }
 
 
-def get_result(ip_address=None):
-    if not ip_address:
-        ip_address = request.remote_addr
-
-    cache_key = f"geoip.result:{ip_address}"
+def _get_results(ip_addresses):
+    result_cache = current_app.extensions["geoip_cache"]
 
-    result = worker_cache.get(cache_key)
-    if result:
-        return result
+    ttl = current_app.config.get("GEOIP_CACHE_SECONDS", 86400)
+    negative_ttl = current_app.config.get("GEOIP_NEGATIVE_CACHE_SECONDS", 300)
 
-    result = shared_cache.get(cache_key)
-    if result:
-        return result
+    results = {}
+    result_keys = {}
+    for ip_address in ip_addresses:
+        try:
+            result_keys[ip_address] = ipaddress.ip_address(ip_address).packed
+        except ValueError:
+            # e.g. no remote address, there's nothing to look up and parsing is
+            # cheaper than caching the miss
+            results[ip_address] = None
+
+    for ip_address, result_key in result_keys.items():
+        result = result_cache.get(result_key, _missing)
+        if result is not _missing:
+            results[ip_address] = result
+
+    missing = [ip for ip in result_keys if ip not in results]
+    if missing:
+        cache_keys = [f"geoip.record:{ip}" for ip in missing]
+        for ip_address, result in zip(missing, shared_cache.get_many(*cache_keys)):
+            if result:
+                results[ip_address] = result
+                result_cache.set(result_keys[ip_address], result, ttl)
+
+    missing = [ip for ip in result_keys if ip not in results]
+    if not missing:
+        return results
 
     webservice_options = current_app.config.get_namespace("GEOIP_WEBSERVICE_")
 
@@ -137,25 +356,64 @@ def get_result(ip_address=None):
     license_key = webservice_options.get("license_key")
 
     if account_id and license_key:
-        result = _get_result_webservice(ip_address, webservice_options)
+        found = {}
+        webservice_results = _get_results_webservice(missing, webservice_options)
+        for ip_address, result in webservice_results.items():
+            if result:
+                results[ip_address] = found[f"geoip.record:{ip_address}"] = result
 
-    if not result:
-        database = current_app.config.get(
-            "GEOIP_DATABASE",
-            os.environ.get("GEOIP_DATABASE"),
+        if found:
+            shared_cache.set_many(found, ttl)
+
+    database = current_app.config.get(
+        "GEOIP_DATABASE",
+        os.environ.get("GEOIP_DATABASE"),
+    )
+
+    if database and any(not results.get(ip) for ip in missing):
+        reader = _get_reader(database)
+
+        for ip_address in missing:
+            if not results.get(ip_address):
+                results[ip_address] = _get_result_database(ip_address, reader)
+
+    for ip_address in missing:
+        result = results.setdefault(ip_address, None)
+
+        # misses, like private addresses, are cached for less time
+        result_cache.set(
+            result_keys[ip_address], result, result and ttl or negative_ttl
         )
 
-        if database:
-            result = _get_result_database(ip_address, database)
+    return results
 
-    ttl = current_app.config.get("GEOIP_CACHE_SECONDS", 86400)
 
-    if result and account_id and license_key:
-        shared_cache.set(cache_key, result, ttl)
+def get_cache_stats():
+    """Return the hit, miss and eviction counts and size of this worker's result
+    cache."""
+    return current_app.extensions["geoip_cache"].get_stats()
+
+
+def get_result(ip_address=None):
+    if not ip_address:
+        ip_address = request.remote_addr
+
+    result = _get_results([ip_address])[ip_address]
     if result:
-        worker_cache.set(cache_key, result, ttl)
+        return _localize_result(result)
 
-    return result
+
+def get_results(ip_addresses):
+    """Return the results for many addresses at once, keyed by address.
+
+    Addresses are deduplicated, cached results are fetched in one go and the rest
+    are looked up with a single database reader.
+    """
+    ip_addresses = dict.fromkeys(str(ip) for ip in ip_addresses if ip)
+
+    results = _get_results(ip_addresses)
+
+    return {ip: result and _localize_result(result) for ip, result in results.items()}
 
 
 def get_city(ip_address=None):
@@ -213,7 +471,10 @@ def get_timezone(ip_address=None):
 
 
 def get_location(ip_address=None, default=UNKNOWN_LOCATION):
-    result = get_result(ip_address)
+    return format_location(get_result(ip_address), default)
+
+
+def format_location(result, default=UNKNOWN_LOCATION):
     if not result:
         return default
     city = result.get("city")
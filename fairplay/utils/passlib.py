@@ -1,10 +1,192 @@
+import collections
+import concurrent.futures
+import functools
+import os
+import statistics
+import threading
+import time
+
 from flask import current_app
 from passlib.context import CryptContext
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
 
+from .background import PerProcess
+
+
+HASHING_POOLS = {
+    "process": concurrent.futures.ProcessPoolExecutor,
+    "thread": concurrent.futures.ThreadPoolExecutor,
+}
+
+
+class HashingPool:
+    """Run password hashing on a bounded pool of workers.
+
+    At most ``max_workers`` hashes run at once with up to ``max_queue`` more
+    waiting, anything past that is rejected with a 429 so a burst of logins can't
+    tie up every request thread. Hashes that take longer than ``timeout`` seconds
+    are given up on with a 503.
+    """
+
+    def __init__(self, executor_class, max_workers, max_queue, timeout):
+        self.executor = executor_class(max_workers)
+        self.timeout = timeout
+
+        self.completed = self.rejected = self.timed_out = 0
+        self.latencies = collections.deque(maxlen=1000)
+
+        # callbacks run on the pool's threads, concurrently with requests
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+            latencies = sorted(self.latencies)
+
+        if len(latencies) > 1:
+            p50, p95 = (statistics.quantiles(latencies, n=20)[i] for i in (9, 18))
+        else:
+            p50 = p95 = latencies and latencies[0] or None
+
+        return {**stats, "latency_p50": p50, "latency_p95": p95}
+
+    def run(self, f, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise TooManyRequests(retry_after=1)
+
+        start = time.perf_counter()
+
+        def done(future):
+            self._slots.release()
+            if future.cancelled():
+                return
+
+            with self._lock:
+                self.completed += 1
+                self.latencies.append((time.perf_counter() - start) * 1000)
+
+        future = self.executor.submit(f, *args)
+        future.add_done_callback(done)
+
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            # frees the slot if it hasn't started, otherwise it finishes unused
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise ServiceUnavailable(retry_after=1)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_context(ctx_string):
+    return CryptContext.from_string(ctx_string)
+
+
+def _dummy_verify(ctx_string):
+    return _load_context(ctx_string).dummy_verify()
+
+
+def _hash(ctx_string, password, category):
+    return _load_context(ctx_string).hash(password, category=category)
+
+
+def _verify_and_update(ctx_string, password, hash, category):
+    return _load_context(ctx_string).verify_and_update(
+        password, hash, category=category
+    )
+
+
+def _get_context():
+    config = current_app.config
+
+    # unlike get_namespace this doesn't evaluate every other setting, which is slow
+    options = {
+        key[8:].lower(): config.get(key)
+        for key in config.keys()
+        if key.startswith("PASSLIB_")
+    }
+    options_key = repr(sorted(options.items()))
+
+    cached = current_app.extensions.get("passlib")
+    if cached and cached[0] == options_key:
+        return cached
 
-def get_passlib_context():
-    options = current_app.config.get_namespace("PASSLIB_")
     schemes = options.pop("schemes", ["pbkdf2_sha256", "plaintext"])
     options.setdefault("deprecated", ["auto"])
 
-    return CryptContext(schemes, **options)
+    ctx = CryptContext(schemes, **options)
+    cached = current_app.extensions["passlib"] = options_key, ctx, ctx.to_string()
+
+    return cached
+
+
+def _create_pool(pool_type, config):
+    max_workers = config.get("AUTH_HASHING_WORKERS", min(4, os.cpu_count() or 1))
+
+    return HashingPool(
+        HASHING_POOLS[pool_type],
+        max_workers,
+        config.get("AUTH_HASHING_QUEUE_SIZE", max_workers * 4),
+        config.get("AUTH_HASHING_TIMEOUT", 10),
+    )
+
+
+def _get_pool():
+    pool_type = current_app.config.get("AUTH_HASHING_POOL", "thread")
+    if not pool_type:
+        return
+
+    # each app has its own pool, and each worker process its own executor
+    pool = current_app.extensions.get("passlib_pool")
+    if not pool:
+        pool = current_app.extensions.setdefault(
+            "passlib_pool", PerProcess(_create_pool)
+        )
+
+    return pool.get(pool_type, current_app.config)
+
+
+def _run(f, *args):
+    _, _, ctx_string = _get_context()
+
+    pool = _get_pool()
+    if not pool:
+        return f(ctx_string, *args)
+
+    return pool.run(f, ctx_string, *args)
+
+
+def dummy_verify():
+    """Spend as long as verifying a password, so missing users can't be told apart."""
+    return _run(_dummy_verify)
+
+
+def get_hashing_stats():
+    """Return the number of completed, rejected and timed out hashes, and
+    latencies in ms, for this worker."""
+    pool = _get_pool()
+    if pool:
+        return pool.get_stats()
+
+
+def get_passlib_context():
+    """Return the app's password context, only building it again if the
+    ``PASSLIB_*`` settings change."""
+    _, ctx, _ = _get_context()
+    return ctx
+
+
+def hash_password(password, category=None):
+    return _run(_hash, password, category)
+
+
+def verify_and_update_password(password, hash, category=None):
+    return _run(_verify_and_update, password, hash, category)
@@ -0,0 +1,6 @@
+def test_index_shows_worker_stats(client):
+    response = client.get("/admin")
+
+    assert response.status_code == 200
+    assert b"GeoIP cache" in response.data
+    assert b"Password hashing" in response.data
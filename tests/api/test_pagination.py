@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        encode_cursor({"next": []}),
+        encode_cursor(["next", 5]),
+        encode_cursor(["next", ["2024-01-01T00:00:00"]]),
+        encode_cursor(["next", [5, 5]]),
+        encode_cursor(["sideways", ["2024-01-01T00:00:00", None]]),
+    ],
+)
+def test_invalid_cursor(client, cursor):
+    response = client.get("/api/v1/games", query_string={"cursor": cursor})
+
+    assert response.status_code == 400
+
+
+def test_first_page(client):
+    response = client.get("/api/v1/games", query_string={"cursor": ""})
+
+    assert response.status_code == 200
+    assert response.json == []
+
+
+def test_exact_total(client):
+    response = client.get("/api/v1/games", query_string={"count": "exact"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Pagination-Total"] == "0"
@@ -0,0 +1,21 @@
+from fairplay.auth.manager import user_loader
+from fairplay.auth.models import User
+from fairplay.db import db
+
+
+def test_bulk_disable_logs_out_user(app):
+    user = User(name_first="Ada", name_last="Lovelace", email="ada@example.com")
+    db.session.add(user)
+    db.session.commit()
+
+    user_id = str(user.id)
+
+    with app.test_request_context():
+        assert user_loader(user_id).is_active
+
+    # as the admin does when several users are disabled at once
+    User.query.filter(User.id.in_([user_id])).update({"active": False})
+    db.session.commit()
+
+    with app.test_request_context():
+        assert not user_loader(user_id).is_active
@@ -0,0 +1,81 @@
+import geoalchemy2
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy_utils.types.pg_composite import remove_composite_listeners
+
+# every model is imported before create_app configures the mappers
+import fairplay.courses.models  # noqa: F401
+import fairplay.games.models  # noqa: F401
+import fairplay.players.models  # noqa: F401
+
+from fairplay import create_app
+from fairplay.cache import near_cache
+from fairplay.db import db
+
+
+# blueprints are registered in order, nested ones before their parents
+MODULES = ("admin", "courses.api", "games.api", "players.api", "api.v1", "api")
+
+
+def _make_sqlite_compatible(metadata):
+    """Drop the parts of the schema that need PostgreSQL and PostGIS.
+
+    Geography columns become plain text, which is enough for tests that don't look
+    at positions.
+    """
+    remove_composite_listeners()
+
+    for table in metadata.tables.values():
+        for index in list(table.indexes):
+            if index.dialect_options["postgresql"]["using"] in ("gin", "gist"):
+                table.indexes.discard(index)
+
+        # "index" is a keyword in SQLite
+        for constraint in list(table.constraints):
+            if isinstance(constraint, sa.CheckConstraint):
+                table.constraints.discard(constraint)
+
+        for column in table.columns:
+            if isinstance(column.type, geoalchemy2.Geography):
+                column.type = sa.Text()
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    database = tmp_path_factory.mktemp("db") / "app.db"
+
+    app = create_app(
+        DATABASE_URL=f"sqlite:///{database}",
+        GEOIP_DATABASE="",
+        SECRET_KEY="testing",
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+    )
+
+    for name in MODULES:
+        module = __import__(f"fairplay.{name}", fromlist=["init_app"])
+        module.init_app(app)
+
+    _make_sqlite_compatible(db.metadata)
+
+    return app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.create_all()
+
+        yield db
+
+        db.session.remove()
+        db.drop_all()
+
+        near_cache.local.clear()
+        near_cache.remote.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
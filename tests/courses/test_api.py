@@ -0,0 +1,119 @@
+import pytest
+import sqlalchemy as sa
+
+from fairplay.courses.models import Course, CourseFeature, CourseHole
+from fairplay.db import db
+
+
+@pytest.fixture
+def course():
+    course = Course(name="Augusta")
+    db.session.add(course)
+    db.session.commit()
+
+    return course
+
+
+def get_course(client, course):
+    response = client.get(f"/api/v1/courses/{course.id}")
+    assert response.status_code == 200
+    return response
+
+
+def update_course(client, course, etag):
+    return client.post(
+        f"/api/v1/courses/{course.id}",
+        json={"name": "Augusta National"},
+        headers={"If-Match": etag},
+    )
+
+
+def test_delete_hole_refreshes_course(client, course):
+    db.session.add(CourseHole(course=course, number=1))
+    db.session.commit()
+
+    response = get_course(client, course)
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/api/v1/courses/{course.id}/holes/1")
+    response = client.delete(
+        f"/api/v1/courses/{course.id}/holes/1",
+        headers={"If-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 204
+
+    response = get_course(client, course)
+    assert response.headers["ETag"] != etag
+
+    assert update_course(client, course, etag).status_code == 412
+    assert update_course(client, course, response.headers["ETag"]).status_code == 200
+
+
+def test_update_requires_if_match(app, client, course, monkeypatch):
+    def update():
+        return client.post(
+            f"/api/v1/courses/{course.id}", json={"name": "Augusta National"}
+        )
+
+    assert update().status_code == 412
+
+    monkeypatch.setitem(app.config, "API_REQUIRE_IF_MATCH", False)
+    assert update().status_code == 200
+
+
+def test_bulk_update_refreshes_course(client, course):
+    etag = get_course(client, course).headers["ETag"]
+
+    Course.query.filter(Course.id == course.id).update({"name": "Augusta National"})
+    db.session.commit()
+
+    response = get_course(client, course)
+    assert response.headers["ETag"] != etag
+    assert response.json["name"] == "Augusta National"
+
+
+def test_batch_create_holes_refreshes_course(client, course):
+    etag = get_course(client, course).headers["ETag"]
+
+    response = client.post(
+        f"/api/v1/courses/{course.id}/holes/batch",
+        json=[{"number": 1, "index": 1, "par": 4}, {"number": 2, "index": 2, "par": 3}],
+    )
+    assert response.status_code == 201
+
+    response = get_course(client, course)
+    assert response.headers["ETag"] != etag
+
+    assert update_course(client, course, etag).status_code == 412
+    assert update_course(client, course, response.headers["ETag"]).status_code == 200
+
+
+def test_batch_delete_holes_refreshes_course(client, course):
+    db.session.add_all([CourseHole(course=course, number=n) for n in (1, 2)])
+    db.session.commit()
+
+    etag = get_course(client, course).headers["ETag"]
+
+    response = client.delete(f"/api/v1/courses/{course.id}/holes/batch", json=[1, 2])
+    assert response.status_code == 204
+
+    response = get_course(client, course)
+    assert response.headers["ETag"] != etag
+
+
+def test_bulk_update_skips_uncached_models(course):
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    sa.event.listen(db.engine, "before_cursor_execute", before_execute)
+    try:
+        CourseFeature.query.filter(CourseFeature.hole_id.is_(None)).update(
+            {"type": "bunker"}
+        )
+    finally:
+        sa.event.remove(db.engine, "before_cursor_execute", before_execute)
+
+    # features aren't cached, so there's nothing to look up and clear
+    assert statements == ["UPDATE"]
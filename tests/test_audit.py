@@ -0,0 +1,106 @@
+import datetime as dt
+import types
+
+import pytest
+import sqlalchemy as sa
+
+from fairplay import audit as audit_module
+from fairplay.audit import AuditEvent, AuditEventBuffer, audit
+from fairplay.db import db
+
+
+def test_buffered_events_follow_transaction(app, monkeypatch):
+    events = []
+    buffer = types.SimpleNamespace(put=events.append)
+    monkeypatch.setitem(app.extensions, "audit", buffer)
+
+    with app.test_request_context():
+        audit("test", "rolled_back", "Rolled back")
+        db.session.rollback()
+        assert events == []
+
+        audit("test", "committed", "Committed")
+        assert events == []
+
+        db.session.commit()
+        assert [e["event"] for e in events] == ["committed"]
+
+
+@pytest.fixture
+def buffer(app, monkeypatch):
+    # events are only written when the test flushes them
+    monkeypatch.setitem(app.config, "AUDIT_FLUSH_INTERVAL", 60)
+    monkeypatch.setitem(app.config, "AUDIT_WRITE_RETRIES", 1)
+
+    return AuditEventBuffer(app)
+
+
+def test_buffer_retries_failed_batch(buffer, monkeypatch):
+    written = []
+
+    def write(rows):
+        if not written:
+            written.append(None)
+            raise RuntimeError("database is down")
+        written.extend(rows)
+
+    monkeypatch.setattr(buffer, "write", write)
+
+    buffer.put({"event": "created"})
+
+    assert buffer.flush() == 0
+    assert buffer.get_stats()["retrying"] == 1
+
+    assert buffer.flush() == 1
+    assert written[1:] == [{"event": "created"}]
+    assert buffer.get_stats() == {"dropped": 0, "lost": 0, "queued": 0, "retrying": 0}
+
+
+def test_buffer_counts_lost_events(buffer, monkeypatch):
+    def write(rows):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(buffer, "write", write)
+
+    buffer.put({"event": "created"})
+    buffer.close()
+
+    assert buffer.get_stats()["lost"] == 1
+
+
+@pytest.fixture
+def postgresql_engine(monkeypatch):
+    """An engine that claims to be PostgreSQL and records statements instead of
+    running them."""
+    engine = sa.create_engine("sqlite://")
+    engine.dialect.name = "postgresql"
+    engine.statements = []
+
+    @sa.event.listens_for(engine, "before_execute", retval=True)
+    def before_execute(conn, clauseelement, multiparams, params, options):
+        engine.statements.append(str(clauseelement))
+        return sa.text("SELECT 1"), multiparams, params
+
+    monkeypatch.setattr(audit_module, "_known_partitions", set())
+
+    return engine
+
+
+def test_partition_created_once_per_transaction(postgresql_engine):
+    date = dt.datetime(2024, 1, 15, tzinfo=dt.timezone.utc)
+
+    with postgresql_engine.connect() as connection:
+        with connection.begin() as transaction:
+            for _ in range(3):
+                AuditEvent.create_partition(connection, date)
+            transaction.rollback()
+
+        assert len(postgresql_engine.statements) == 1
+        assert not audit_module._known_partitions
+
+        with connection.begin():
+            for _ in range(3):
+                AuditEvent.create_partition(connection, date)
+
+    assert len(postgresql_engine.statements) == 2
+    assert audit_module._known_partitions == {"audit_202401"}
@@ -0,0 +1,107 @@
+import gc
+import time
+
+import fakeredis
+
+from fairplay import cache as cache_module
+from fairplay.cache import Cache, LayeredCache, shared_cache
+
+
+def test_stale_if_error_refreshes_unversioned_value(app):
+    @shared_cache.stale_if_error(cache_key="tests.stale")
+    def f():
+        return "new"
+
+    # as cached before expiry was stored with the value
+    shared_cache.set("tests.stale", {"iat": time.time(), "value": "old"})
+
+    assert f() == "old"
+
+    deadline = time.monotonic() + 1
+    while "exp" not in shared_cache.get("tests.stale"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert f() == "new"
+
+
+def test_stale_if_error_key_from_arguments(app):
+    calls = []
+
+    @shared_cache.stale_if_error(cache_key=lambda n: f"tests.square:{n}")
+    def square(n):
+        calls.append(n)
+        return n * n
+
+    assert square(3) == 9
+    assert square(3) == 9
+    assert calls == [3]
+    assert shared_cache.get("tests.square:3")["value"] == 9
+
+
+def test_process_locks_are_per_key(app):
+    lock = shared_cache.get_lock("tests.a")
+
+    assert shared_cache.get_lock("tests.a") is lock
+    assert shared_cache.get_lock("tests.b") is not lock
+
+    # a refresh holding one key's lock doesn't hold up another key
+    with lock:
+        assert shared_cache.get_lock("tests.b").acquire(blocking=False)
+
+    # and locks nobody holds are freed
+    del lock
+    gc.collect()
+    assert "tests.a" not in cache_module._process_locks
+
+
+def test_stale_if_error_nested(app):
+    @shared_cache.stale_if_error(cache_key=lambda n: f"tests.inner:{n}")
+    def inner(n):
+        return n
+
+    @shared_cache.stale_if_error(cache_key=lambda n: f"tests.outer:{n}")
+    def outer(n):
+        return sum(inner(i) for i in range(n))
+
+    assert outer(100) == 4950
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 2
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_layered_cache_invalidates_other_workers(app):
+    server = fakeredis.FakeServer()
+
+    remote = Cache()
+    remote.init_app(app, {"CACHE_TYPE": "RedisCache"})
+    backend = app.extensions["cache"][remote]
+    backend._read_client = backend._write_client = fakeredis.FakeRedis(server=server)
+
+    workers = []
+    for _ in range(2):
+        local = Cache()
+        local.init_app(app, {"CACHE_TYPE": "SimpleCache"})
+
+        worker = LayeredCache(local, remote)
+        worker.init_app(app)
+        workers.append(worker)
+
+    this, other = workers
+
+    # the other worker subscribes the first time it's used
+    this.set("tests.layered", "old")
+    assert other.get("tests.layered") == "old"
+    wait_for(lambda: backend._write_client.pubsub_numsub(other.channel)[0][1])
+
+    this.set("tests.layered", "new")
+    wait_for(lambda: other.local.get("tests.layered") is None)
+    assert other.get("tests.layered") == "new"
+
+    this.delete("tests.layered")
+    wait_for(lambda: other.local.get("tests.layered") is None)
+    assert other.get("tests.layered") is None
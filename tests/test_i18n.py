@@ -0,0 +1,34 @@
+from fairplay.i18n import Fake, create_faker, get_faker
+
+
+def test_faker_loads_providers_lazily():
+    faker = create_faker("de_DE")
+    assert not faker.providers
+
+    assert faker.city()
+    assert [p.__provider__ for p in faker.providers] == ["faker.providers.address"]
+    assert faker.providers[0].__lang__ == "de_DE"
+
+    # formats using another provider's formatters load it too
+    assert faker.free_email()
+    assert {p.__provider__ for p in faker.providers} == {
+        "faker.providers.address",
+        "faker.providers.internet",
+        "faker.providers.person",
+    }
+
+
+def test_faker_loads_locale_only_formatters():
+    assert create_faker("ja_JP").kana_name()
+
+
+def test_seeding_leaves_shared_faker_alone():
+    shared = get_faker("en_US")
+    assert get_faker("en_US") is shared
+
+    first, second = create_faker("en_US"), create_faker("en_US")
+    assert first is not shared
+    first.seed_instance(1)
+    second.seed_instance(1)
+    assert Fake(first).batch("name", 5) == Fake(second).batch("name", 5)
+    assert shared.random is not first.random
@@ -0,0 +1,17 @@
+import os
+
+from fairplay.utils import background
+from fairplay.utils.background import PerProcess
+
+
+def test_per_process_recreated_after_fork(monkeypatch):
+    value = PerProcess(object)
+
+    first = value.get()
+    assert value.created
+    assert value.get() is first
+
+    # as seen by a forked worker
+    monkeypatch.setattr(background.os, "getpid", lambda: os.getppid())
+    assert not value.created
+    assert value.get() is not first
@@ -0,0 +1,182 @@
+import concurrent.futures
+import http.server
+import ipaddress
+import json
+import threading
+import time
+
+import pytest
+
+from fairplay.utils import geoip
+from fairplay.utils.background import PerProcess
+
+
+STUB_NETWORK = ipaddress.ip_network("192.0.2.0/24")
+
+SLOW_ADDRESS = "192.0.2.2"
+
+
+def _encode_control(type, size):
+    # types past 7 are extended, their number less 7 follows the control byte
+    if type > 7:
+        return bytes([size, type - 7])
+    return bytes([type << 5 | size])
+
+
+def _encode_uint(type, value, length):
+    return _encode_control(type, length) + value.to_bytes(length, "big")
+
+
+def _encode(value):
+    if isinstance(value, str):
+        value = value.encode()
+        return _encode_control(2, len(value)) + value
+    if isinstance(value, list):
+        return _encode_control(11, len(value)) + b"".join(map(_encode, value))
+    if isinstance(value, dict):
+        items = (_encode(k) + _encode(v) for k, v in value.items())
+        return _encode_control(7, len(value)) + b"".join(items)
+    return value
+
+
+def write_database(path, record):
+    """Write an IPv4 city database with a single network, in the MMDB format."""
+    node_count = STUB_NETWORK.prefixlen
+    address = int(STUB_NETWORK.network_address)
+
+    tree = b""
+    for i in range(node_count):
+        empty = node_count
+        follow = i + 1 if i + 1 < node_count else node_count + 16
+        bit = address >> (31 - i) & 1
+        left, right = (empty, follow) if bit else (follow, empty)
+        tree += left.to_bytes(3, "big") + right.to_bytes(3, "big")
+
+    metadata = {
+        "binary_format_major_version": _encode_uint(5, 2, 2),
+        "binary_format_minor_version": _encode_uint(5, 0, 2),
+        "build_epoch": _encode_uint(9, int(time.time()), 8),
+        "database_type": "GeoLite2-City",
+        "description": {"en": "Test database"},
+        "ip_version": _encode_uint(5, 4, 2),
+        "languages": ["en"],
+        "node_count": _encode_uint(6, node_count, 4),
+        "record_size": _encode_uint(5, 24, 2),
+    }
+
+    path.write_bytes(
+        tree
+        + bytes(16)
+        + _encode(record)
+        + b"\xab\xcd\xefMaxMind.com"
+        + _encode(metadata)
+    )
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        ip_address = self.path.rsplit("/", 1)[-1]
+        if ip_address == SLOW_ADDRESS:
+            time.sleep(0.5)
+
+        body = json.dumps(
+            {
+                "city": {"names": {"en": "Webservice"}},
+                "country": {"iso_code": "GB", "names": {"en": "United Kingdom"}},
+                "traits": {"ip_address": ip_address, "network": str(STUB_NETWORK)},
+            }
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.maxmind.com-city+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webservice(app, monkeypatch, tmp_path):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    database = tmp_path / "city.mmdb"
+    write_database(
+        database,
+        {
+            "city": {"names": {"en": "Database"}},
+            "country": {"iso_code": "GB", "names": {"en": "United Kingdom"}},
+        },
+    )
+
+    host, port = server.server_address
+    for key, value in {
+        "GEOIP_DATABASE": str(database),
+        "GEOIP_WEBSERVICE_ACCOUNT_ID": 1,
+        "GEOIP_WEBSERVICE_BASE_URI": f"http://{host}:{port}/geoip/v2.1",
+        "GEOIP_WEBSERVICE_LICENSE_KEY": "key",
+        "GEOIP_WEBSERVICE_TIMEOUT": 0.2,
+    }.items():
+        monkeypatch.setitem(app.config, key, value)
+
+    yield server
+
+    server.shutdown()
+    app.extensions["geoip_cache"].clear()
+
+
+def test_webservice(app, webservice):
+    with app.test_request_context():
+        result = geoip.get_result("192.0.2.1")
+
+    assert result["city"] == "Webservice"
+
+
+def test_webservice_timeout_falls_back_to_database(app, webservice):
+    with app.test_request_context():
+        results = geoip.get_results(["192.0.2.1", SLOW_ADDRESS])
+
+    assert results["192.0.2.1"]["city"] == "Webservice"
+    assert results[SLOW_ADDRESS]["city"] == "Database"
+
+
+def test_webservice_lookups_share_deadline(monkeypatch):
+    def lookup(client, ip_address):
+        time.sleep(0.3)
+        return {"city": ip_address}
+
+    monkeypatch.setattr(geoip, "_lookup_webservice", lookup)
+    monkeypatch.setattr(
+        geoip, "_webservice_executor", PerProcess(geoip._create_webservice_executor)
+    )
+
+    options = {"account_id": 1, "license_key": "key", "max_workers": 1, "timeout": 0.5}
+    ip_addresses = ["192.0.2.1", "192.0.2.2", "192.0.2.3"]
+
+    start = time.monotonic()
+    results = geoip._get_results_webservice(ip_addresses, options)
+
+    assert time.monotonic() - start < 0.6
+    assert results == {"192.0.2.1": {"city": "192.0.2.1"}}
+
+
+def test_webservice_lookup_forgets_only_itself(monkeypatch):
+    monkeypatch.setattr(geoip, "_webservice_lookups", {})
+
+    done, newer = concurrent.futures.Future(), object()
+    done.add_done_callback(geoip._forget_webservice_lookup("192.0.2.1"))
+
+    geoip._webservice_lookups["192.0.2.1"] = newer
+    done.set_result(None)
+
+    assert geoip._webservice_lookups["192.0.2.1"] is newer
+
+
+@pytest.mark.parametrize("ip_address", [None, "", "not an address"])
+def test_invalid_address(app, ip_address):
+    with app.test_request_context(environ_base={"REMOTE_ADDR": ip_address}):
+        assert geoip._get_results([ip_address]) == {ip_address: None}
+        assert geoip.get_result() is None
+        assert geoip.get_location() == "Unknown"
@@ -0,0 +1,22 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from fairplay.utils.passlib import HashingPool
+
+
+def test_hashing_pool_timeout():
+    pool = HashingPool(concurrent.futures.ThreadPoolExecutor, 1, 0, 0.01)
+
+    with pytest.raises(ServiceUnavailable) as excinfo:
+        pool.run(time.sleep, 0.2)
+
+    assert excinfo.value.code == 503
+    assert dict(excinfo.value.get_headers())["Retry-After"] == "1"
+    assert pool.get_stats()["timed_out"] == 1
+
+    pool.executor.shutdown()
+    assert pool.get_stats()["completed"] == 1